@@ -1,30 +1,27 @@
 # UNC-CH Computational Social Science Workshop
 
 import re #for regular expressions
-import numpy as np #math functions in python
-import pandas as pd #data manipulation software
-from selenium import webdriver
-from datetime import date
+from datetime import datetime
+from driver_pool import DriverPool #shared pool of warm browsers
+from record_buffer import RecordBuffer #collects rows before they become a data frame
+from reddit_extraction import REDDIT_KIA_SCHEMA #the columns of our reddit data frame
 
 
 # What we're going to do here is effectively bring together a lot of what we've done so far, and we'll scrape some
 # information and save it in a Python spreadsheet. Python's spreadsheet and data analysis library is
-# called Pandas, which we import as pd.
+# called Pandas. We don't import it here ourselves: the RecordBuffer below builds the pandas data frame for us.
 
 # But first we need to go figure out what we want to gather and navigate there with selenium. Let's say we're
 # interested in political content, so let's go check reddit again.
 
-def chromeprofile():
-    options = webdriver.ChromeOptions()
-    prefs = {'download.default_directory': 'INSERT WORKING DIRECTORY HERE',
-             "profile.default_content_setting_values.notifications": 2}
-    options.add_experimental_option('prefs', prefs)
-    driver = webdriver.Chrome(options=options)
-    return driver
-
-
-# First we need to start up chrome.
-driver = chromeprofile()
+# First we need a copy of chrome. We borrow one from the pool in driver_pool.py, which starts it for us and keeps it
+# running until pool.close() at the end of this script. It uses the same chromeprofile() settings as before (download
+# directory, notifications off), and runs headless by default, so no window shows up. Add headless=False to watch it.
+# lean=True skips everything on the page we don't need for text: images, fonts, video, and the ad and tracking servers.
+# Reddit threads load a lot faster without them. The promoted posts on the front page still show up, since reddit serves
+# those itself, so we still have to skip those below.
+pool = DriverPool(size=1, download_dir='INSERT WORKING DIRECTORY HERE', lean=True)
+driver = pool.acquire()
 
 
 # Now let's go to a political subreddit. KotakuInAction is an odd political subreddit. It's focused on a particular
@@ -147,7 +144,7 @@ original_post_date_string = original_post_date_element.text
 # patterns. So what we're going to do here is match some patterns to get much more usable data.
 
 # Creating the pattern here
-original_post_time_regex = re.compile(r'(\d*)(\s*)(year|years|month|months|week|weeks|day|days|hour|hours|second|seconds)(\s*)(ago)')
+original_post_time_regex = re.compile(r'(\d*)(\s*)(year|years|month|months|week|weeks|day|days|hour|hours|minute|minutes|second|seconds)(\s*)(ago)')
 # Telling python to match the pattern to the text we have
 original_post_time_match = re.match(original_post_time_regex, original_post_date_string)
 
@@ -215,7 +212,9 @@ comment_time_unit = post_match.group(11)
 comment_text = post_match.group(15)
 
 # Just to wrap this up, we have the following variables, including the original poster section and a variable
-# that is generating today's date, so we can calculate the day that the post is from.
+# that holds when we read the page, so we can calculate when the post is from. That has to be the time and not just
+# today's date: "3 hours ago" counts back from when we looked, and counting back from midnight would be off by however
+# far into the day we ran this.
 
 
 original_poster #String
@@ -223,14 +222,14 @@ original_post_title #String
 original_post_time_numeric #Integer
 original_post_time_units #String
 original_post_text_string #String
-current_date = date.today() #datetime
+current_date = datetime.now() #datetime
 original_post_positive = 1
 reply_negative = 0
 
 comment_user_name #String
 comment_time_numeric #integer
 comment_time_unit #String
-current_date = date.today()
+current_date #datetime, the same time as above, since it's the same page
 comment_text # String
 original_post_negative = 0
 reply_positive = 1
@@ -240,28 +239,32 @@ reply_positive = 1
 # including the relations of things. Even though we wont be able to completely preserve the structure of the original
 # data, we can still keep track of what's an original post, what's a reply, and what the replies are to.
 
-reddit_kia = pd.DataFrame({'username': pd.Series(dtype='str'),
-                    'original_post_title': pd.Series(dtype='str'),
-                    'post_time_numeric': pd.Series(dtype='int64'),
-                     'post_time_units': pd.Series(dtype='str'),
-                           'current_date': pd.to_datetime(0),
-                    'post_text': pd.Series(dtype='str'),
-                    'original_post': pd.Series(dtype='int64'),
-                    'reply': pd.Series(dtype='int64')})
+# Rather than making an empty data frame and adding rows to it one at a time with
+# reddit_kia.loc[len(reddit_kia.index)] = [...], we collect the rows in a RecordBuffer from record_buffer.py. Adding a
+# row to a data frame copies the whole thing every time, which gets really slow once you have thousands of comments.
+# The buffer keeps a list per column and builds the data frame at the end. We tell it the columns and their types up
+# front, in order. The original post's time can be missing, so it uses 'Int64', which is pandas' integer type that
+# allows empty values.
+
+reddit_kia_records = RecordBuffer(REDDIT_KIA_SCHEMA, chunk_size=5000)
 
 
-# Now let's input our information into the pandas dataframe. We can do this by column index. Let's start with the
-# original post.
+# Now let's input our information. We can do this by column order. Let's start with the original post. The buffer also
+# checks each value against the type of its column, so if we mixed up the order (say put the post text where the date
+# goes) it would stop us right here instead of quietly saving the text in the date column.
 
-reddit_kia.loc[len(reddit_kia.index)] = [original_poster, original_post_title, original_post_time_numeric,
-                                         original_post_time_units, original_post_text_string, current_date,
-                                         original_post_positive, reply_negative]
+reddit_kia_records.append([original_poster, original_post_title, original_post_time_numeric,
+                           original_post_time_units, current_date, original_post_text_string,
+                           original_post_positive, reply_negative])
 
 
-#Now let's add the first reply
-reddit_kia.loc[len(reddit_kia.index)] = (comment_user_name, original_post_title, comment_time_numeric,
-                                         comment_time_unit, current_date, comment_text, original_post_negative,
-                                         reply_positive)
+#Now let's add the first reply. The regex gives us the number as a string, so we turn it into an integer first.
+reddit_kia_records.append([comment_user_name, original_post_title, int(comment_time_numeric),
+                           comment_time_unit, current_date, comment_text, original_post_negative,
+                           reply_positive])
+
+# And now we turn everything we've collected into a pandas data frame.
+reddit_kia = reddit_kia_records.to_frame()
 
 
 
@@ -269,3 +272,81 @@ reddit_kia.loc[len(reddit_kia.index)] = (comment_user_name, original_post_title,
 # it hits the second comment since there's some extra text in some of the usernames that needs to be dealt with, but
 # that's part of the process. Regular expressions specifically and scraping like this generally are fundamentally
 # iterative processes where exceptions happen and you need to work with them.
+
+
+# SCALING UP
+# Everything above makes a separate trip to chromedriver for every .text, get_attribute() and find_element_by_xpath()
+# call. That's great for figuring out where things live on the page, but on a big thread it adds up to thousands of
+# trips. reddit_extraction.py does the same steps inside the browser with one execute_script call per page, and hands
+# back the same fields we built by hand above.
+
+from reddit_extraction import thread_links, extract_thread, thread_records
+from reddit_extraction import expand_comments, extract_comments, comment_records, COMMENT_TREE_SCHEMA
+
+driver.get('https://www.reddit.com/r/KotakuInAction/')
+workinglinks = thread_links(driver)
+
+# We'll also keep a copy of every thread we load with page_cache.py. When we rerun this after fixing a regular expression,
+# the thread comes off the disk instead of reddit. Threads change, so copies older than 6 hours don't count.
+# cache.open() works like driver.get(), and prepare opens up the whole thread before the copy is saved: it clicks
+# "View Entire Discussion" and every "N more replies" button, a batch of them per trip to the browser, until none
+# are left.
+from page_cache import PageCache
+
+cache = PageCache('page_cache', ttl={'www.reddit.com': 6 * 60 * 60})
+
+def open_all_comments(thread_driver):
+    expand_comments(thread_driver)
+
+# workinglinks starts from scratch every time we run this, so every thread gets scraped again, even the ones we got
+# yesterday. url_frontier.py keeps the list of threads to scrape in a file instead, along with every thread we've
+# already done. Adding a thread we've done (under any version of its url) does nothing until a day has passed, so a
+# rerun only picks up the threads that are new since last time. priority keeps them in the order reddit showed them.
+from url_frontier import Frontier
+
+frontier = Frontier('reddit_frontier.sqlite', ttl={'www.reddit.com': 24 * 60 * 60})
+frontier.add_many(workinglinks, priority=[len(workinglinks) - i for i in range(len(workinglinks))])
+
+# reddit_kia only knows whether a row is the original post or a reply. extract_comments() also reads each comment's
+# id, the id of the comment it answers, how deep it sits and its score, so comment_tree keeps who replied to whom.
+comment_tree_records = RecordBuffer(COMMENT_TREE_SCHEMA, chunk_size=5000)
+
+for link in frontier.pop(5):
+    try:
+        cache.open(driver, link, prepare=open_all_comments)
+        # A thread that came off the disk was captured when it was saved, not now, and "3 hours ago" counts from then.
+        captured_at = cache.info(link)['fetched_at']
+        thread = extract_thread(driver, captured_at=captured_at)
+        tree = extract_comments(driver, expand=False, captured_at=captured_at)
+    except Exception:
+        frontier.failed(link)
+        continue
+    reddit_kia_records.extend(thread_records(thread, thread['captured_at']))
+    comment_tree_records.extend(comment_records(tree, tree['captured_at']))
+    frontier.done(link)
+reddit_kia = reddit_kia_records.to_frame()
+comment_tree = comment_tree_records.to_frame()
+
+# We still only have "3 hours ago" split into a number and a unit. relative_time.py turns those into actual times for
+# the whole column at once, counting back from when each page was captured (the current_date column).
+from relative_time import resolve_time_parts
+
+reddit_kia['post_time'] = resolve_time_parts(reddit_kia['post_time_numeric'], reddit_kia['post_time_units'],
+                                             reddit_kia['current_date'])
+
+# KEEPING UP
+# If this runs on a schedule (every hour, say), the frontier still opens every thread again once a day and reads all
+# of its comments. subreddit_monitor.py remembers, for each thread, how many comments the front page said it had and
+# the id of every comment we've saved. Each poll reads the front page once, opens only the threads that are new or
+# whose comment count changed, and adds just the comments we haven't seen to the end of reddit_kia_comments.csv.
+from subreddit_monitor import SubredditMonitor
+
+monitor = SubredditMonitor('reddit_monitor.sqlite', deltas='reddit_kia_comments.csv')
+poll = monitor.poll(driver, 'https://www.reddit.com/r/KotakuInAction/')
+print(poll)
+new_comments = poll.comments
+monitor.close()
+
+# When we're done, hand the browser back to the pool and shut the pool's browsers down.
+pool.release(driver)
+pool.close()
@@ -6,30 +6,27 @@
 # types of web elements or website structures like iframes, the documentation provides good and clear examples.
 # https://www.selenium.dev/documentation/en/webdriver/browser_manipulation/
 
-from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import Select
 
 # This chunk of code is important for one thing - Selenium cannot access your computer, it only interacts with the
 # webbrowser. The dialogue box that shows up when you click "download" and asks if you want to open it, save it, or
 # save to a location, is part of your computer and not the webbrowser. This lets you automatically download files to
-# a specific location on your computer. It defines a function with no arguments that sets the options for selenium.
-# the second preference setting disables browswer level notifications. Reddit started showing a notification for some
-# reason and it was getting in the way.
+# a specific location on your computer. The chromeprofile() in driver_pool.py sets these options for selenium, and it
+# also disables browswer level notifications. Reddit started showing a notification for some reason and it was getting
+# in the way. The pool in driver_pool.py starts the browser for us and lends it out, so the rest of this script can
+# borrow it and hand it back instead of starting a new one each time. The browsers in it only last until the script
+# ends. They run headless (without a window) by default now, so headless=False below is what lets us watch what's
+# happening.
 
+from driver_pool import DriverPool
 
-def chromeprofile():
-    options = webdriver.ChromeOptions()
-    prefs = {'download.default_directory': 'C:\\Users\\Will\\Documents\\ArticleLinks',
-             "profile.default_content_setting_values.notifications": 2}
-    options.add_experimental_option('prefs', prefs)
-    driver = webdriver.Chrome(options=options)
-    return driver
+pool = DriverPool(size=1, download_dir='C:\\Users\\Will\\Documents\\ArticleLinks', headless=False)
 
 
 # What we're gonna do right now is navigate through a couple webpages using selenium.
-# Now start a selenium instance of chrome, using the function we just defined.
-driver = chromeprofile()
+# Now borrow a selenium instance of chrome from the pool.
+driver = pool.acquire()
 
 # First thing we're going to do is go to google. You can go to any url with driver.get('url')
 driver.get('https://www.google.com')
@@ -364,7 +361,12 @@ driver.switch_to.window(original_window)
 # has the title "Next Page". We can use these with find_element_by_xpath to find this web element.
 next_page = driver.find_element_by_xpath('//a[@title="Next Page"]')
 
-# Now that we found it, we can click it to go to the next page, and continue data collection.
+# Now that we found it, we can click it to go to the next page, and continue data collection. If you want to go through
+# every page of results, crawl_clicks() in pagination.py does this click, wait, collect loop for you until there's no
+# Next Page link left.
 
 next_page.click()
-driver.close()
+# Hand the browser back to the pool when we're done, then shut every browser in the pool down. Without pool.close()
+# the chrome windows (and chromedriver) keep running after the script ends.
+pool.release(driver)
+pool.close()
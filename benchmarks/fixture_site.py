@@ -0,0 +1,303 @@
+# UNC-CH Computational Social Science Workshop
+# A fake version of the sites the scripts scrape, served from this computer.
+#
+# Timing a scrape against the real reddit or ProQuest mostly measures how busy they are that day. This serves made-up
+# pages with the same structure (the same selectors, the same kind of Next links, the same lazy loading) from a little
+# web server on localhost, so the same code runs against the same pages every time and the numbers can be compared from
+# one run to the next. Everything is generated from the page's url and a fixed random seed, so nothing is stored.
+#
+#     with FixtureSite() as site:
+#         driver.get(site.url('/r/KotakuInAction/comments/abc123/thread/?comments=500'))
+#
+# The pages:
+#   /r/KotakuInAction/                              front page: ?threads=N links, plus ads with no href. Every
+#                                                   thread shows (and has) ?comments=N comments
+#   /r/KotakuInAction/comments/<id>/thread/         a thread: ?comments=N comments, nested up to ?depth=D levels.
+#                                                   ?shown=N hides all but the first N behind a "View entire
+#                                                   discussion" button, and ?collapse=D hides replies D levels down
+#                                                   behind "N more replies" buttons, loaded ?delay_ms=N after a click
+#   /results                                        ProQuest results: ?page=N of ?total=N hits, ?per_page=100 a page
+#   /docview/<id>/fulltext                          a ProQuest article with ?paragraphs=N paragraphs
+#   /listing                                        a paginated listing: ?page=N of ?pages=N, Next and numbered links
+#   /lazy                                           an article whose ?images=N images only load when scrolled to
+#   /img/<n>.png                                    a tiny image, sent after ?delay_ms=N milliseconds
+
+import random
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+WORDS = ('protest police city council officers march crowd statement community justice floyd minneapolis street '
+         'chief mayor video rally reform department night downtown peaceful sunday vigil leaders residents').split()
+STATES = ('AZ', 'MO', 'VA', 'TN', 'NC', 'MN', 'CA', 'NY')
+UNITS = ('minutes', 'hours', 'days', 'months')
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4890000000d49444154789c6360000002'
+                    '00000100e221bc330000000049454e44ae426082')
+
+# The wrapper divs that make reddit_extraction.THREAD_SELECTOR match the comment list.
+_THREAD_OPEN = ('<div id="SHORTCUT_FOCUSABLE_DIV"><div></div><div></div><div></div><div><div>'
+                '<div class="_1npCwF50X2J7Wt82SZi6J0 _3OGqXkiUb_0ZMlksb26boO">'
+                '<div class="u35lf2ynn4jHsVUwPmNU Dx3UxiK86VcfkFQVHNXNi _3KaECfUAGLfWQPO5eNjMNl">'
+                '<div class="uI_hDmU5GSiudtABRz_37"><div class="_2M2wOqmeoPVvcSsJ6Po9-V">')
+_THREAD_CLOSE = '</div></div></div></div></div></div></div>'
+
+# Sets each image's src from data-src once it's within a screen of the viewport, the way Medium does.
+_LAZY_JS = """
+function reveal() {
+    document.querySelectorAll('img[data-src]').forEach(function (img) {
+        if (img.getBoundingClientRect().top < window.innerHeight * 2) {
+            img.src = img.dataset.src;
+            img.removeAttribute('data-src');
+        }
+    });
+}
+window.addEventListener('scroll', reveal);
+reveal();
+"""
+
+# Swaps a hidden block of comments into the page a little while after its button is clicked, the way reddit fetches
+# them. The hidden comments sit in <template> tags, which aren't part of the page until they're swapped in.
+_REVEAL_JS = """
+document.addEventListener('click', function (event) {
+    var button = event.target.closest('button[data-reveal]');
+    if (!button) { return; }
+    setTimeout(function () {
+        var hidden = document.getElementById(button.dataset.reveal);
+        hidden.replaceWith(hidden.content.cloneNode(true));
+        button.parentElement.remove();
+    }, %d);
+});
+"""
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _page(title, body, script=''):
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s</title></head><body>%s%s</body></html>'
+            % (escape(title), body, '<script>%s</script>' % script if script else ''))
+
+
+def front_page(query):
+    count = int(query.get('threads', 25))
+    comments = int(query.get('comments', 200))
+    thread_query = '?comments=%d' % comments if 'comments' in query else ''
+    rng = random.Random('front')
+    links = []
+    for number in range(count):
+        href = '/r/KotakuInAction/comments/t%05d/thread/%s' % (number, thread_query)
+        links.append('<div class="Post"><a data-click-id="body" href="%s"><h3>%s</h3></a>'
+                     '<a data-click-id="comments" href="%s">%d comments</a></div>'
+                     % (href, escape(_words(rng, 6).capitalize()), href, comments))
+        if number % 5 == 4:
+            links.append('<div class="Post promoted"><a data-click-id="body"><h3>Promoted</h3></a></div>')
+    return _page('r/KotakuInAction', ''.join(links))
+
+
+# Comments come out in the order reddit shows them (each reply right after its parent), with reddit's t1_ ids, the
+# "level N" label and the indent that the real page uses for nesting.
+def thread_comments(thread_id, count, max_depth):
+    rng = random.Random('thread-' + thread_id)
+    comments = []
+    stack = []
+    for number in range(count):
+        depth = rng.randint(0, min(len(stack), max_depth - 1)) if stack else 0
+        del stack[depth:]
+        comment = {'id': 't1_%s%05d' % (thread_id, number), 'parent': stack[-1]['id'] if stack else None,
+                   'depth': depth, 'author': 'user_%d' % rng.randint(1, max(count // 3, 1)),
+                   'score': rng.randint(-5, 500), 'age': '%d %s ago' % (rng.randint(1, 11), rng.choice(UNITS)),
+                   'text': _words(rng, rng.randint(5, 60))}
+        comments.append(comment)
+        stack.append(comment)
+    return comments
+
+
+def _comment_html(comment):
+    return ('<div class="Comment %s" id="%s" style="padding-left: %dpx">'
+            '<div>level %d</div><div><a href="/user/%s/">%s</a></div><div>·</div>'
+            '<div><span>%d points</span></div><div>%s</div><div data-testid="comment">%s</div></div>'
+            % (comment['id'], comment['id'], 16 * comment['depth'], comment['depth'] + 1, comment['author'],
+               comment['author'], comment['score'], comment['age'], escape(comment['text'])))
+
+
+def _hidden(key, comments_html, label):
+    return ('<template id="more-%s">%s</template><div><button data-reveal="more-%s">%s</button></div>'
+            % (key, comments_html, key, label))
+
+
+# Runs of comments at depth collapse or deeper go behind a "N more replies" button each.
+def _collapsed_html(comments, collapse):
+    parts = []
+    run = []
+    for comment in comments + [None]:
+        if comment is not None and collapse is not None and comment['depth'] >= collapse:
+            run.append(comment)
+            continue
+        if run:
+            label = '%d more %s' % (len(run), 'reply' if len(run) == 1 else 'replies')
+            parts.append(_hidden(run[0]['id'], ''.join(_comment_html(c) for c in run), label))
+            run = []
+        if comment is not None:
+            parts.append(_comment_html(comment))
+    return ''.join(parts)
+
+
+def thread_page(thread_id, query):
+    count = int(query.get('comments', 200))
+    depth = int(query.get('depth', 6))
+    shown = int(query['shown']) if 'shown' in query else None
+    collapse = int(query['collapse']) if 'collapse' in query else None
+    rng = random.Random('post-' + thread_id)
+    post = ('<div data-test-id="post-content"><a href="/user/op_%s/">op_%s</a><h1>%s</h1>'
+            '<a data-click-id="timestamp">%d hours ago</a>%s</div>'
+            % (thread_id, thread_id, escape(_words(rng, 8).capitalize()), rng.randint(1, 23),
+               ''.join('<p>%s</p>' % _words(rng, 40) for _ in range(3))))
+    comments = thread_comments(thread_id, count, depth)
+    # The hidden part of the discussion starts at a top-level comment, so no reply is cut off from its parent.
+    split = len(comments)
+    if shown is not None:
+        split = next((n for n in range(shown, len(comments)) if comments[n]['depth'] == 0), len(comments))
+    html = _collapsed_html(comments[:split], collapse)
+    if split < len(comments):
+        html += _hidden('discussion', _collapsed_html(comments[split:], collapse),
+                        'View Entire Discussion (%d comments)' % len(comments))
+    script = _REVEAL_JS % int(query.get('delay_ms', 50)) if shown is not None or collapse is not None else ''
+    return _page('thread ' + thread_id, post + _THREAD_OPEN + html + _THREAD_CLOSE, script)
+
+
+def results_page(query):
+    total = int(query.get('total', 500))
+    per_page = int(query.get('per_page', 100))
+    page = int(query.get('page', 1))
+    rng = random.Random('results-%d' % page)
+    rows = []
+    for number in range((page - 1) * per_page, min(page * per_page, total)):
+        pq_id = 2400000000 + number
+        author = '%s, %s' % (rng.choice(WORDS).capitalize(), rng.choice(WORDS).capitalize())
+        details = ('<span class="truncatedAuthor">%s</span>. The %s Times; %s. [%s]. %02d June 2020: A.%d.'
+                   % (author, rng.choice(WORDS).capitalize(), rng.choice(STATES), rng.choice(STATES),
+                      rng.randint(1, 30), rng.randint(1, 9)))
+        rows.append('<li class="resultItem"><h3><a id="citationDocTitleLink%d" href="/docview/%d/fulltext">%s</a></h3>'
+                    '<div class="titleAuthorETC">%s</div></li>'
+                    % (number, pq_id, escape(_words(rng, 7).capitalize()), details))
+    pager = ''
+    if page * per_page < total:
+        pager = ('<a title="Next Page" href="/results?page=%d&total=%d&per_page=%d">Next page</a>'
+                 % (page + 1, total, per_page))
+    return _page('ProQuest results page %d' % page, '<ul>%s</ul>%s' % (''.join(rows), pager))
+
+
+def docview_page(pq_id, query):
+    count = int(query.get('paragraphs', 12))
+    rng = random.Random('docview-' + pq_id)
+    paragraphs = ''.join('<p>%s</p>' % _words(rng, rng.randint(30, 120)) for _ in range(count))
+    return _page('Document ' + pq_id, '<div id="docview"><div class="contentPadingDocview">%s</div></div>' % paragraphs)
+
+
+def listing_page(query):
+    pages = int(query.get('pages', 20))
+    page = int(query.get('page', 1))
+    rng = random.Random('listing-%d' % page)
+    items = ''.join('<li class="item"><a href="/item/%d-%d">%s</a></li>' % (page, number, _words(rng, 5))
+                    for number in range(25))
+    numbers = ' '.join('<a class="page" href="/listing?page=%d&pages=%d">%d</a>' % (n, pages, n)
+                       for n in range(max(1, page - 4), min(pages, page + 5) + 1) if n != page)
+    next_link = ('<a href="/listing?page=%d&pages=%d">Next</a>' % (page + 1, pages)) if page < pages else ''
+    return _page('Listing page %d' % page, '<ul>%s</ul><div class="pager">%s %s</div>' % (items, numbers, next_link))
+
+
+def lazy_page(query):
+    count = int(query.get('images', 30))
+    delay = int(query.get('delay_ms', 20))
+    rng = random.Random('lazy')
+    sections = []
+    for number in range(count):
+        target = ' id="target"' if number == count - 1 else ''
+        sections.append('<section><p>%s</p><figure><img%s width="600" height="400" data-src="/img/%d.png?delay_ms=%d">'
+                        '</figure></section>' % (_words(rng, 80), target, number, delay))
+    return _page('Lazy article', '<article>%s</article>' % ''.join(sections), _LAZY_JS)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        path = parts.path.rstrip('/').split('/')
+        self.server.requests += 1
+        if parts.path.startswith('/img/'):
+            time.sleep(int(query.get('delay_ms', 0)) / 1000)
+            return self._send(PNG, 'image/png')
+        if parts.path.rstrip('/') == '/r/KotakuInAction':
+            body = front_page(query)
+        elif len(path) >= 5 and path[1:4] == ['r', 'KotakuInAction', 'comments']:
+            body = thread_page(path[4], query)
+        elif parts.path == '/results':
+            body = results_page(query)
+        elif len(path) >= 3 and path[1] == 'docview':
+            body = docview_page(path[2], query)
+        elif parts.path == '/listing':
+            body = listing_page(query)
+        elif parts.path == '/lazy':
+            body = lazy_page(query)
+        else:
+            return self._send(_page('Not found', 'Not found').encode('utf-8'), 'text/html; charset=utf-8', 404)
+        self._send(body.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Starts the server on a free port in a background thread. url() gives the full address of a page on it, and requests
+# counts how many pages and images it has sent.
+class FixtureSite:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        self._thread = None
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def url(self, path='/'):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d%s' % (host, port, path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with FixtureSite(port=8765) as site:
+        print('Serving the fixture site at %s (Ctrl+C to stop)' % site.url())
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
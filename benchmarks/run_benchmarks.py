@@ -0,0 +1,303 @@
+# UNC-CH Computational Social Science Workshop
+# Timing each scraping flow against the fixture site.
+#
+# Run it from the top folder of the repo:
+#
+#     python benchmarks/run_benchmarks.py
+#     python benchmarks/run_benchmarks.py --flows reddit_thread fulltext_browser --scale 4 --save before.json
+#     python benchmarks/run_benchmarks.py --compare before.json
+#     python benchmarks/run_benchmarks.py --lean --compare before.json
+#
+# For each flow it reports how many records it pulled out, pages per second, records per second, WebDriver round trips
+# per record (every command selenium sends to chromedriver is one trip there and back, counted with a DriverTrace from
+# driver_trace.py), the most memory python used
+# along the way, and how big the page's javascript memory got in the browser. --save writes the numbers to a json file,
+# and --compare prints how much each number changed since a saved run, so a change that makes things slower shows up.
+# --trace saves every WebDriver command, labelled with its flow, so you can see where a slow flow spends its time.
+#
+# The flows that need a browser are skipped (with a note) if chrome can't be started. The rest still run.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixture_site import FixtureSite  # noqa: E402
+
+from driver_pool import DriverPool  # noqa: E402
+from driver_trace import DriverTrace  # noqa: E402
+from fulltext_fetcher import fetch_fulltext  # noqa: E402
+from http_fetch import HttpFetcher  # noqa: E402
+from pagination import crawl_links  # noqa: E402
+from proquest import scrape_all_pages  # noqa: E402
+from reddit_extraction import extract_comments, extract_thread, thread_links  # noqa: E402
+from scroll_harvest import scroll_harvest  # noqa: E402
+from subreddit_monitor import SubredditMonitor  # noqa: E402
+from waits import Waiter  # noqa: E402
+
+
+_HEAP_JS = 'return window.performance.memory ? window.performance.memory.usedJSHeapSize : null'
+
+
+class Measurement:
+    def __init__(self, flow, records, pages, elapsed, round_trips, python_peak, browser_heap):
+        self.flow = flow
+        self.records = records
+        self.pages = pages
+        self.elapsed = elapsed
+        self.round_trips = round_trips
+        self.python_peak = python_peak
+        self.browser_heap = browser_heap
+
+    def numbers(self):
+        return {'records': self.records,
+                'pages': self.pages,
+                'seconds': self.elapsed,
+                'pages_per_second': self.pages / self.elapsed if self.elapsed else 0.0,
+                'records_per_second': self.records / self.elapsed if self.elapsed else 0.0,
+                'round_trips_per_record': self.round_trips / self.records if self.records else None,
+                'python_peak_mb': self.python_peak / 1024 ** 2,
+                'browser_heap_mb': self.browser_heap / 1024 ** 2 if self.browser_heap is not None else None}
+
+
+# What every flow gets: the fixture site, the pool (None when there's no browser) and somewhere to note the page's
+# javascript memory.
+class Bench:
+    def __init__(self, site, pool, trace, scale, workers):
+        self.site = site
+        self.pool = pool
+        self.trace = trace
+        self.scale = scale
+        self.workers = workers
+        self.browser_heap = None
+
+    def sample_heap(self, driver):
+        heap = driver.execute_script(_HEAP_JS)
+        if heap is not None:
+            self.browser_heap = max(self.browser_heap or 0, heap)
+
+
+FLOWS = {}
+
+
+def flow(name, browser):
+    def register(function):
+        FLOWS[name] = (function, browser)
+        return function
+    return register
+
+
+# Each flow returns (records, pages).
+
+@flow('http_docview', browser=False)
+def http_docview(bench):
+    urls = [bench.site.url('/docview/%d/fulltext' % (2400000000 + n)) for n in range(50 * bench.scale)]
+    text, report = fetch_fulltext(urls, None, workers=bench.workers, http=HttpFetcher(), progress_every=0)
+    return int(text.notna().sum()), len(urls)
+
+
+@flow('http_results', browser=False)
+def http_results(bench):
+    http = HttpFetcher()
+    pages = 5 * bench.scale
+    records = 0
+    for page in range(1, pages + 1):
+        url = bench.site.url('/results?page=%d&total=%d' % (page, pages * 100))
+        records += len(http.fetch(url, '//li[@class="resultItem"]//h3/a', attribute='href').items)
+    return records, pages
+
+
+@flow('reddit_front', browser=True)
+def reddit_front(bench):
+    with bench.pool.borrow() as driver:
+        driver.get(bench.site.url('/r/KotakuInAction/?threads=%d' % (25 * bench.scale)))
+        links = thread_links(driver)
+        bench.sample_heap(driver)
+    return len(links), 1
+
+
+@flow('reddit_thread', browser=True)
+def reddit_thread(bench):
+    records = 0
+    pages = 3
+    with bench.pool.borrow() as driver:
+        for number in range(pages):
+            url = '/r/KotakuInAction/comments/b%05d/thread/?comments=%d' % (number, 500 * bench.scale)
+            driver.get(bench.site.url(url))
+            thread = extract_thread(driver)
+            records += len(thread['comments']) + (thread['post'] is not None)
+            bench.sample_heap(driver)
+    return records, pages
+
+
+# The same threads with most of the discussion behind "View Entire Discussion" and "N more replies" buttons, read as a
+# reply tree.
+@flow('reddit_tree', browser=True)
+def reddit_tree(bench):
+    records = 0
+    pages = 3
+    with bench.pool.borrow() as driver:
+        for number in range(pages):
+            url = ('/r/KotakuInAction/comments/c%05d/thread/?comments=%d&shown=50&collapse=3'
+                   % (number, 500 * bench.scale))
+            driver.get(bench.site.url(url))
+            records += len(extract_comments(driver)['comments'])
+            bench.sample_heap(driver)
+    return records, pages
+
+
+# Three polls of the front page with a fresh monitor: the first opens every thread, the second finds nothing new, and
+# the third sees more comments on every thread and only pulls out the new ones. Records are the comments saved.
+@flow('reddit_monitor', browser=True)
+def reddit_monitor(bench):
+    threads = 5 * bench.scale
+    records = 0
+    pages = 0
+    with SubredditMonitor(':memory:') as monitor, bench.pool.borrow() as driver:
+        for comments in (100, 100, 120):
+            url = bench.site.url('/r/KotakuInAction/?threads=%d&comments=%d' % (threads, comments))
+            poll = monitor.poll(driver, url)
+            records += len(poll.comments)
+            pages += 1 + len(poll.fetched)
+        bench.sample_heap(driver)
+    return records, pages
+
+
+@flow('proquest_results', browser=True)
+def proquest_results(bench):
+    with bench.pool.borrow() as driver:
+        driver.get(bench.site.url('/results?page=1&total=%d' % (500 * bench.scale)))
+        results = scrape_all_pages(driver, waiter=Waiter(timeout=20))
+        bench.sample_heap(driver)
+    return len(results), (500 * bench.scale + 99) // 100
+
+
+@flow('fulltext_browser', browser=True)
+def fulltext_browser(bench):
+    urls = [bench.site.url('/docview/%d/fulltext' % (2400000000 + n)) for n in range(20 * bench.scale)]
+    text, report = fetch_fulltext(urls, bench.pool, workers=bench.workers, progress_every=0)
+    with bench.pool.borrow() as driver:
+        bench.sample_heap(driver)
+    return int(text.notna().sum()), len(urls)
+
+
+@flow('pagination', browser=True)
+def pagination(bench):
+    pages = 10 * bench.scale
+
+    def items(driver):
+        return driver.execute_script('return Array.from(document.querySelectorAll("li.item a"))'
+                                     '.map(function (a) { return a.href; })')
+
+    crawl = crawl_links(bench.pool, bench.site.url('/listing?page=1&pages=%d' % pages), items,
+                        page_links_xpath='//a[@class="page"]', workers=bench.workers, max_pages=pages)
+    with bench.pool.borrow() as driver:
+        bench.sample_heap(driver)
+    return sum(len(data) for url, data in crawl.pages), len(crawl.pages)
+
+
+@flow('lazy_article', browser=True)
+def lazy_article(bench):
+    with bench.pool.borrow() as driver:
+        driver.get(bench.site.url('/lazy?images=%d' % (30 * bench.scale)))
+        harvest = scroll_harvest(driver, 'img', attribute='src', until='#target[src]', idle_ms=100)
+        bench.sample_heap(driver)
+    return len(harvest.items), 1
+
+
+def run_flow(name, bench):
+    function, browser = FLOWS[name]
+    bench.browser_heap = None
+    before = len(bench.trace)
+    tracemalloc.start()
+    started = time.perf_counter()
+    with bench.trace.phase(name):
+        records, pages = function(bench)
+    elapsed = time.perf_counter() - started
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return Measurement(name, records, pages, elapsed, len(bench.trace) - before, python_peak, bench.browser_heap)
+
+
+def _format(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '%.2f' % value
+    return str(value)
+
+
+def print_table(measurements, baseline=None):
+    columns = ['records', 'pages_per_second', 'records_per_second', 'round_trips_per_record', 'python_peak_mb',
+               'browser_heap_mb']
+    print('%-18s' % 'flow' + ''.join('%24s' % column for column in columns))
+    for measurement in measurements:
+        numbers = measurement.numbers()
+        cells = []
+        for column in columns:
+            cell = _format(numbers[column])
+            old = (baseline or {}).get(measurement.flow, {}).get(column)
+            if old and numbers[column] is not None:
+                cell += ' (%+.0f%%)' % (100.0 * (numbers[column] - old) / old)
+            cells.append('%24s' % cell)
+        print('%-18s' % measurement.flow + ''.join(cells))
+
+
+def start_pool(size, trace, lean=False):
+    pool = DriverPool(size=size, factory=trace.factory(), headless=True, lean=lean)
+    try:
+        pool.warm()
+    except Exception as e:
+        pool.close()
+        print('Skipping the browser flows, chrome could not be started (%s: %s)'
+              % (type(e).__name__, str(e).strip().splitlines()[0] if str(e).strip() else ''))
+        return None
+    return pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the scraping flows against a local fixture site.')
+    parser.add_argument('--flows', nargs='+', choices=sorted(FLOWS), default=list(FLOWS))
+    parser.add_argument('--scale', type=int, default=1, help='multiplies the size of every page and crawl')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--save', help='write the numbers to this json file')
+    parser.add_argument('--compare', help='show the change from the numbers in this json file')
+    parser.add_argument('--lean', action='store_true', help="use chromeprofile's lean mode (no images, fonts or ads)")
+    parser.add_argument('--trace', help='save every WebDriver command to this file (.csv, or .json for chrome://tracing)')
+    args = parser.parse_args(argv)
+
+    trace = DriverTrace(default_phase='setup')
+    measurements = []
+    with FixtureSite() as site:
+        pool = None
+        if any(FLOWS[name][1] for name in args.flows):
+            pool = start_pool(args.workers, trace, args.lean)
+        bench = Bench(site, pool, trace, args.scale, args.workers)
+        try:
+            for name in args.flows:
+                if FLOWS[name][1] and pool is None:
+                    continue
+                measurements.append(run_flow(name, bench))
+        finally:
+            if pool is not None:
+                pool.close()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(measurements, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({m.flow: m.numbers() for m in measurements}, f, indent=1)
+    if args.trace:
+        trace.dump(args.trace)
+    return measurements
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# UNC-CH Computational Social Science Workshop
+# Loading the article metadata once and slicing it quickly.
+#
+# data/floyd_news_md.csv has a row per article, and most of its columns repeat the same few values over and over:
+# source_type is nearly always "Newspapers", there are only ~50 states and 4 census regions. Stored as plain text every
+# row keeps its own copy of the string. Here those columns are stored as pandas categoricals instead, which keep each
+# distinct value once and a small number per row pointing at it.
+#
+# We also slice by date, state and region constantly. df[df['state'] == 'NC'] compares every row, every time. Instead we
+# work out once where everything is:
+#   - the rows are kept sorted by date, so a date range is one contiguous block we find with a binary search;
+#   - a sorted copy of pq_id finds any article by id with a binary search;
+#   - for every state and every region we keep the list of rows that have it, so looking one up is a dictionary lookup.
+# That keeps slices well under a millisecond however big the corpus gets.
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORY_COLUMNS = ('source_type', 'publication_title', 'document_type', 'copyright', 'city', 'state', 'census_region')
+FLAG_COLUMNS = ('tca', 'university_news')
+
+
+# For each value of a categorical column, the rows (in date order) that have it.
+def _hash_index(column):
+    codes = column.cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(column.cat.categories) + 1))
+    return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(column.cat.categories)}
+
+
+# frame is the article metadata (columns like data/floyd_news_md.csv). Use Corpus.from_csv() to load the file directly.
+#
+#     corpus = Corpus.from_csv('data/floyd_news_md.csv')
+#     corpus.select(start='2020-06-01', end='2020-06-07', states=['NC', 'SC'])
+#     corpus.by_id(2409841526)
+class Corpus:
+    def __init__(self, frame, key='pq_id', date_column='date', state_column='state', region_column='census_region',
+                 categories=CATEGORY_COLUMNS):
+        self.key = key
+        self.date_column = date_column
+        frame = frame.copy()
+        frame[date_column] = pd.to_datetime(frame[date_column]).astype('datetime64[ns]')
+        for column in categories:
+            if column in frame:
+                frame[column] = frame[column].astype('category')
+        for column in FLAG_COLUMNS:
+            if column in frame and frame[column].notna().all():
+                frame[column] = frame[column].astype('int8')
+        self.frame = frame.sort_values([date_column, key], kind='stable').reset_index(drop=True)
+
+        self._dates = self.frame[date_column].to_numpy()
+        ids = self.frame[key].to_numpy()
+        self._id_order = np.argsort(ids, kind='stable')
+        self._ids = ids[self._id_order]
+        self._states = _hash_index(self.frame[state_column]) if state_column in self.frame else {}
+        self._regions = _hash_index(self.frame[region_column]) if region_column in self.frame else {}
+
+    @classmethod
+    def from_csv(cls, path, **kw):
+        return cls(pd.read_csv(path, dtype={category: 'category' for category in CATEGORY_COLUMNS}), **kw)
+
+    # For a CorpusStore from corpus_store.py. Only the columns you ask for are read from disk.
+    @classmethod
+    def from_store(cls, store, columns=None, **kw):
+        return cls(store.read(columns=columns), **kw)
+
+    def __len__(self):
+        return len(self.frame)
+
+    # How much memory the data frame takes up, in bytes.
+    def memory_usage(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+    # The rows (positions in self.frame) between start and end, both days included.
+    def date_rows(self, start=None, end=None):
+        low = 0 if start is None else np.searchsorted(self._dates, np.datetime64(pd.Timestamp(start), 'ns'), 'left')
+        if end is None:
+            high = len(self._dates)
+        else:
+            end = np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1), 'ns')
+            high = np.searchsorted(self._dates, end, 'left')
+        return low, high
+
+    # The rows matching every filter you give: a date range, a list of states and/or a list of regions. Comes back in
+    # date order.
+    def rows(self, start=None, end=None, states=None, regions=None):
+        low, high = self.date_rows(start, end)
+        rows = None
+        for index, wanted in ((self._states, states), (self._regions, regions)):
+            if wanted is None:
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            found = [index[value] for value in wanted if value in index]
+            found = np.sort(np.concatenate(found)) if found else np.empty(0, dtype=np.intp)
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+        if rows is None:
+            return np.arange(low, high)
+        return rows[np.searchsorted(rows, low):np.searchsorted(rows, high)]
+
+    def select(self, start=None, end=None, states=None, regions=None, columns=None):
+        rows = self.rows(start, end, states, regions)
+        frame = self.frame if columns is None else self.frame[columns]
+        return frame.iloc[rows]
+
+    # One article by its pq_id (None if we don't have it).
+    def by_id(self, pq_id):
+        position = np.searchsorted(self._ids, pq_id)
+        if position == len(self._ids) or self._ids[position] != pq_id:
+            return None
+        return self.frame.iloc[self._id_order[position]]
+
+    # Several articles by pq_id, in the order asked for. Ids we don't have are left out.
+    def by_ids(self, pq_ids):
+        pq_ids = np.asarray(pq_ids, dtype=self._ids.dtype)
+        positions = np.searchsorted(self._ids, pq_ids).clip(max=len(self._ids) - 1)
+        found = self._ids[positions] == pq_ids
+        return self.frame.iloc[self._id_order[positions[found]]]
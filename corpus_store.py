@@ -0,0 +1,154 @@
+# UNC-CH Computational Social Science Workshop
+# Keeping every export and scrape in one place that's quick to read back.
+#
+# Each ProQuest export is its own .xls, and pd.read_excel is slow and memory hungry. data/floyd_news_md.csv gets parsed
+# from scratch every session. Here each batch of articles is added to a single store of Parquet files instead. Parquet
+# keeps each column separately, so reading only the title and date columns doesn't read the full text at all. The files
+# are split up into folders by month and state (month=2020-06/state=AZ/part.parquet), so asking for June articles from
+# North Carolina only opens the files for June in NC.
+#
+# Every article is filed under its pq_id. Adding an article that's already in the store replaces the old copy (an
+# "upsert"), so ingesting the same export twice, or rescraping an article's full text, never leaves duplicates.
+#
+# This needs one more library: pip install pyarrow
+
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+logger = logging.getLogger(__name__)
+
+MISSING = '__missing__'
+_PARTITIONING = ds.partitioning(pa.schema([('month', pa.string()), ('state', pa.string())]), flavor='hive')
+
+
+# directory is where the store lives. key is the column that identifies an article, date_column and state_column are
+# the ones the files are split up by. A batch without a state column is filed under state=__missing__.
+#
+#     store = CorpusStore('corpus_store')
+#     store.upsert(pd.read_csv('data/floyd_news_md.csv'))
+#     store.read(columns=['pq_id', 'title'], states=['NC'], start='2020-06-01', end='2020-06-07')
+class CorpusStore:
+    def __init__(self, directory='corpus_store', key='pq_id', date_column='date', state_column='state'):
+        self.directory = directory
+        self.key = key
+        self.date_column = date_column
+        self.state_column = state_column
+        os.makedirs(directory, exist_ok=True)
+        self._keys_path = os.path.join(directory, '_keys.parquet')
+        self.skipped = None
+        # Which folder every article is in, so an upsert knows which files hold the old copies.
+        if os.path.exists(self._keys_path):
+            self._keys = pd.read_parquet(self._keys_path)
+        else:
+            self._keys = pd.DataFrame({key: pd.Series(dtype='int64'), 'partition': pd.Series(dtype='string')})
+
+    def __len__(self):
+        return len(self._keys)
+
+    # Adds a batch of articles (a data frame), replacing any that are already in the store. Returns how many of them
+    # were new. Rows with no key (merge_exports() keeps articles it couldn't find a pq_id for) can't be filed, so they're
+    # left out with a warning, and kept in store.skipped for you to look at.
+    def upsert(self, frame):
+        missing = frame[self.key].isna()
+        self.skipped = frame[missing]
+        if missing.any():
+            logger.warning('Skipped %d rows with no %s (see store.skipped)', missing.sum(), self.key)
+        batch = self._normalize(frame[~missing])
+        batch = batch.drop_duplicates(self.key, keep='last')
+        months = batch[self.date_column].dt.strftime('%Y-%m').fillna(MISSING)
+        if self.state_column in batch:
+            states = batch[self.state_column].fillna(MISSING)
+        else:
+            states = pd.Series(MISSING, index=batch.index)
+        partitions = 'month=' + months.astype(str) + '/state=' + states.astype(str)
+
+        old = self._keys[self._keys[self.key].isin(batch[self.key])]
+        touched = set(partitions) | set(old['partition'])
+        for partition in sorted(touched):
+            path = os.path.join(self.directory, partition, 'part.parquet')
+            rows = batch[(partitions == partition).to_numpy()].drop(columns=[self.state_column], errors='ignore')
+            if os.path.exists(path):
+                existing = pd.read_parquet(path)
+                existing = existing[~existing[self.key].isin(batch[self.key])]
+                rows = pd.concat([existing, rows], ignore_index=True) if len(rows) else existing
+            self._write(path, rows)
+
+        added = len(batch) - len(old)
+        kept = self._keys[~self._keys[self.key].isin(batch[self.key])]
+        new_keys = pd.DataFrame({self.key: batch[self.key].to_numpy(),
+                                 'partition': partitions.astype('string').to_numpy()})
+        self._keys = pd.concat([kept, new_keys], ignore_index=True)
+        self._keys.to_parquet(self._keys_path + '.tmp', index=False)
+        os.replace(self._keys_path + '.tmp', self._keys_path)
+        return added
+
+    # Reads articles back. columns limits which columns are read (None for all of them). states, start and end (dates
+    # like '2020-06-01', both ends included) limit which articles, and only the folders that can match are opened.
+    def read(self, columns=None, states=None, start=None, end=None):
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=columns or [self.key])
+        condition = None
+        if states is not None:
+            condition = _and(condition, ds.field('state').isin(list(states)))
+        if start is not None:
+            start = pd.Timestamp(start)
+            condition = _and(condition, ds.field('month') >= start.strftime('%Y-%m'))
+            condition = _and(condition, ds.field(self.date_column) >= pa.scalar(start, pa.timestamp('ns')))
+        if end is not None:
+            end = pd.Timestamp(end)
+            condition = _and(condition, ds.field('month') <= end.strftime('%Y-%m'))
+            condition = _and(condition, ds.field(self.date_column) < pa.scalar(end + pd.Timedelta(days=1),
+                                                                               pa.timestamp('ns')))
+        wanted = columns
+        if wanted is not None:
+            wanted = [('state' if column == self.state_column else column) for column in wanted]
+        frame = dataset.to_table(columns=wanted, filter=condition).to_pandas()
+        if 'state' in frame:
+            frame['state'] = frame['state'].astype('string').mask(frame['state'] == MISSING)
+            frame = frame.rename(columns={'state': self.state_column})
+        if columns is None:
+            frame = frame.drop(columns=['month'])
+        return frame
+
+    def _dataset(self):
+        files = [os.path.join(root, name) for root, _, names in os.walk(self.directory)
+                 for name in names if name == 'part.parquet']
+        if not files:
+            return None
+        # Articles scraped at different times can disagree on a column's type (a column that was empty in one batch,
+        # for example), so we agree on one type per column before reading.
+        schema = pa.unify_schemas([pq.read_schema(path) for path in files] + [_PARTITIONING.schema],
+                                  promote_options='permissive')
+        return ds.dataset(files, schema=schema, format='parquet', partitioning=_PARTITIONING,
+                          partition_base_dir=self.directory)
+
+    # Gives every batch the same column types: the key as integers, the date as a timestamp, and text as strings.
+    def _normalize(self, frame):
+        batch = frame.copy()
+        batch[self.key] = pd.to_numeric(batch[self.key], errors='raise').astype('int64')
+        dates = pd.to_datetime(batch[self.date_column], errors='coerce', format='mixed')
+        batch[self.date_column] = dates.astype('datetime64[ns]')
+        for column in batch.columns:
+            if batch[column].dtype == object or isinstance(batch[column].dtype, pd.StringDtype):
+                batch[column] = batch[column].astype('string')
+        return batch
+
+    def _write(self, path, rows):
+        if not len(rows):
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+
+def _and(condition, more):
+    return more if condition is None else condition & more
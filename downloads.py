@@ -0,0 +1,102 @@
+# UNC-CH Computational Social Science Workshop
+# Knowing when a download has finished.
+#
+# chromeprofile() tells chrome where to save downloads, but nothing tells us when a file is actually there. While chrome
+# is downloading it writes to a temporary name ending in .crdownload (firefox uses .part), and only when it's done does it
+# rename the file to its real name. So a download is finished once a new file shows up in the folder that isn't one of
+# those temporary files. On Linux we ask the operating system to tell us whenever something in the folder changes
+# (inotify, pip install inotify_simple), so we find out the moment the rename happens. Everywhere else, or without
+# that library, we just look at the folder a few times a second, which is cheap.
+
+import os
+import sys
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp', '.download')
+
+
+def _finished(directory, name):
+    if name.startswith('.') or name.endswith(PARTIAL_SUFFIXES):
+        return False
+    # Firefox keeps the real name next to the .part file while it's still downloading.
+    if any(os.path.exists(os.path.join(directory, name + suffix)) for suffix in PARTIAL_SUFFIXES):
+        return False
+    return os.path.isfile(os.path.join(directory, name))
+
+
+# Make one of these before you click download. Anything already in the folder then doesn't count as new.
+#
+#     watcher = DownloadWatcher(download_dir)
+#     driver.find_element(By.PARTIAL_LINK_TEXT, 'Continue').click()
+#     path = watcher.wait()
+#
+# poll is how often to look at the folder when inotify isn't available.
+class DownloadWatcher:
+    def __init__(self, directory, poll=0.25, use_inotify=True):
+        self.directory = directory
+        self.poll = poll
+        os.makedirs(directory, exist_ok=True)
+        self.seen = set(os.listdir(directory))
+        self._inotify = None
+        if use_inotify and inotify_simple is not None and sys.platform.startswith('linux'):
+            self._inotify = inotify_simple.INotify()
+            flags = inotify_simple.flags
+            self._inotify.add_watch(directory, flags.MOVED_TO | flags.CLOSE_WRITE | flags.CREATE)
+
+    # The finished files that weren't there before, oldest first. Each file is only ever handed out once.
+    def new_files(self):
+        names = [name for name in os.listdir(self.directory)
+                 if name not in self.seen and _finished(self.directory, name)]
+        self.seen.update(names)
+        paths = [os.path.join(self.directory, name) for name in names]
+        return sorted(paths, key=os.path.getmtime)
+
+    # Waits for the next finished download and returns its path. Raises TimeoutError if nothing arrives in time.
+    def wait(self, timeout=120):
+        deadline = time.monotonic() + timeout
+        while True:
+            new = self.new_files()
+            if new:
+                # If more than one arrived at once, the rest are picked up by the next wait().
+                self.seen.difference_update(os.path.basename(path) for path in new[1:])
+                return new[0]
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('No finished download in %s after %s seconds' % (self.directory, timeout))
+            self._sleep(remaining)
+
+    # Hands every new download to on_file as soon as it's finished, until nothing new has arrived for idle_timeout
+    # seconds. Returns the list of paths.
+    def watch(self, on_file, idle_timeout=60):
+        paths = []
+        while True:
+            try:
+                path = self.wait(idle_timeout)
+            except TimeoutError:
+                return paths
+            on_file(path)
+            paths.append(path)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Sleeps until something in the folder changes (with inotify) or for one poll interval (without it).
+    def _sleep(self, remaining):
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(min(remaining, 5) * 1000))
+        else:
+            time.sleep(min(self.poll, remaining))
@@ -0,0 +1,273 @@
+# UNC-CH Computational Social Science Workshop
+# A shared pool of warm browsers for the scraping scripts.
+#
+# Starting up Chrome is the single slowest fixed cost in every script in this repo. Each script used to define its own
+# chromeprofile() and start a fresh browser every time it ran, and scrape_newspaper_articles.py even started a second
+# one and logged in all over again. Here we keep a few drivers running ("warm") and lend them out. When a script is done
+# with a driver it hands it back to the pool instead of closing it, so the next borrower skips the cold start.
+
+import queue
+import threading
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+# This is the one chromeprofile() that all of the scripts share now. The options are the same ones the scripts used to
+# set by hand: where downloads go, turning off browser notifications (reddit kept showing one), and a user agent string
+# for sites that block selenium's default one. headless runs chrome without a window, which starts faster and uses less
+# memory. Turn it off if you want to watch what the browser is doing.
+#
+# lean=True is for scraping text. It doesn't load images (set images=True if images are what you're collecting), and
+# blocks fonts, video and the ad and tracking sites in BLOCKED_HOSTS. None of those change the text on
+# the page, but they're most of what a page downloads, so pages finish loading sooner and each browser uses less
+# memory. blocked_urls adds your own patterns to block, like '*.gif' or '*comments-widget.example.com*' (* matches
+# anything, and with_query() adds the versions with ?something on the end).
+
+# Ad and tracking servers that show up on the pages we scrape. Blocking them doesn't change any of the page's text.
+BLOCKED_HOSTS = ('doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'google-analytics.com',
+                 'googletagmanager.com', 'googletagservices.com', 'adservice.google.com', 'amazon-adsystem.com',
+                 'facebook.net', 'connect.facebook.com', 'scorecardresearch.com', 'quantserve.com', 'moatads.com',
+                 'taboola.com', 'outbrain.com', 'adnxs.com', 'criteo.com', 'chartbeat.com', 'hotjar.com',
+                 'alb.reddit.com', 'events.redditmedia.com', 'pixel.redditmedia.com')
+FONT_PATTERNS = ('*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot')
+MEDIA_PATTERNS = ('*.mp4', '*.webm', '*.m3u8', '*.ts', '*.mp3', '*.ogg', '*.gifv')
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.avif')
+
+
+# '*.woff2' only matches urls that end in .woff2, and a lot of sites put a version number after it (font.woff2?v=3).
+# This adds a '*.woff2?*' for every pattern, so those get blocked too.
+def with_query(patterns):
+    return [variant for pattern in patterns for variant in (pattern, pattern + '?*')]
+
+
+def chromeprofile(download_dir=None, user_agent=None, headless=True, notifications=False, lean=False, images=None,
+                  blocked_urls=()):
+    options = webdriver.ChromeOptions()
+    prefs = {}
+    if images is None:
+        images = not lean
+    if download_dir is not None:
+        prefs['download.default_directory'] = download_dir
+    if not notifications:
+        prefs['profile.default_content_setting_values.notifications'] = 2
+    if not images:
+        prefs['profile.managed_default_content_settings.images'] = 2
+        options.add_argument('--blink-settings=imagesEnabled=false')
+    if prefs:
+        options.add_experimental_option('prefs', prefs)
+    if user_agent is not None:
+        options.add_argument('user-agent=' + user_agent)
+    if headless:
+        options.add_argument('--headless=new')
+    if lean:
+        options.add_argument('--mute-audio')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--disable-background-networking')
+    driver = webdriver.Chrome(options=options)
+    patterns = list(blocked_urls)
+    if lean:
+        patterns += ['*%s*' % host for host in BLOCKED_HOSTS] + with_query(FONT_PATTERNS + MEDIA_PATTERNS)
+    if not images:
+        patterns += with_query(IMAGE_PATTERNS)
+    if patterns:
+        block_urls(driver, patterns)
+    return driver
+
+
+# Tells chrome not to load anything matching the patterns. Works on any chrome driver, including one from the pool, and
+# replaces whatever was blocked before.
+def block_urls(driver, patterns):
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(patterns)})
+
+
+# A pooled driver behaves exactly like a normal selenium driver, you can call driver.get, driver.find_element,
+# WebDriverWait(driver, 20) and so on. The only difference is that it counts how many pages it has loaded, so the pool
+# knows when it's time to throw the browser away and start a fresh one.
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    def get(self, url):
+        self.pages += 1
+        return self.driver.get(url)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+# The pool itself. size is how many browsers to keep warm, max_pages is how many pages a browser loads before it gets
+# recycled, and max_heap_mb is how big the page's javascript memory can get before it gets recycled. Long running
+# browsers slowly leak memory, so recycling them every so often keeps things fast. setup, if you give one, is run on
+# every new browser right after it starts (logging in, for example). Anything else you pass in (like download_dir or
+# user_agent) is handed to chromeprofile() when a new browser is started.
+#
+# There are two ways to borrow a driver. In a script that runs top to bottom, use acquire() and release():
+#
+#     pool = DriverPool(size=1, download_dir='C:\\Users\\Will\\Documents\\ArticleLinks')
+#     driver = pool.acquire()
+#     ...
+#     pool.release(driver)
+#
+# Or use borrow() in a with block, which hands the driver back for you even if something in the block breaks:
+#
+#     with pool.borrow() as driver:
+#         driver.get(url)
+
+class DriverPool:
+    def __init__(self, size=2, max_pages=200, max_heap_mb=512, factory=chromeprofile, setup=None, **profile):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_heap_mb = max_heap_mb
+        self.factory = factory
+        self.setup = setup
+        self.profile = profile
+        # A LIFO queue hands out the most recently used browser first, which has the warmest cache.
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    # Start all of the browsers up front, so the first borrowers don't pay for the cold start either.
+    def warm(self):
+        while self._reserve_slot():
+            self._idle.put(self._start_driver())
+        return self
+
+    def acquire(self, timeout=None):
+        if self._closed:
+            raise RuntimeError('DriverPool is closed')
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve_slot():
+                    return self._start_driver()
+                try:
+                    pooled = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError('No driver came free within %s seconds' % timeout)
+            if self._healthy(pooled):
+                return pooled
+            # The browser crashed or hung while it was sitting in the pool. Throw it away and try the next one.
+            self._discard(pooled)
+
+    def release(self, pooled):
+        if self._closed:
+            self._quit(pooled)
+            return
+        if not self._healthy(pooled) or self._worn_out(pooled):
+            self._discard(pooled)
+            # Start the replacement in the background so whoever released this driver doesn't have to wait for it.
+            threading.Thread(target=self._replace, daemon=True).start()
+            return
+        self._tidy(pooled)
+        self._idle.put(pooled)
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._started >= self.size:
+                return False
+            self._started += 1
+            return True
+
+    def _start_driver(self):
+        try:
+            pooled = PooledDriver(self.factory(**self.profile))
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+        if self.setup is not None:
+            try:
+                self.setup(pooled)
+            except Exception:
+                self._discard(pooled)
+                raise
+        return pooled
+
+    def _replace(self):
+        if not self._closed and self._reserve_slot():
+            try:
+                pooled = self._start_driver()
+            except WebDriverException:
+                # If chrome won't start right now, acquire() will try again the next time someone needs a driver.
+                return
+            # Starting chrome takes a few seconds, and the pool may have been closed in the meantime. close() only
+            # quits the browsers that are in the pool, so one added after it would be left running for good.
+            with self._lock:
+                if not self._closed:
+                    self._idle.put(pooled)
+                    return
+            self._quit(pooled)
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._started -= 1
+        self._quit(pooled)
+
+    # A health check is just a tiny bit of javascript. If the browser can't answer that, it isn't going to be able to
+    # scrape anything either.
+    def _healthy(self, pooled):
+        try:
+            return pooled.execute_script('return 1') == 1
+        except WebDriverException:
+            return False
+
+    def _worn_out(self, pooled):
+        if self.max_pages is not None and pooled.pages >= self.max_pages:
+            return True
+        if self.max_heap_mb is not None:
+            try:
+                heap = pooled.execute_script(
+                    'return window.performance.memory ? window.performance.memory.usedJSHeapSize : null')
+            except WebDriverException:
+                return True
+            if heap is not None and heap > self.max_heap_mb * 1024 * 1024:
+                return True
+        return False
+
+    # Close any tabs the last borrower left open (like the proquest save popup) so the next borrower starts with one
+    # window in focus.
+    def _tidy(self, pooled):
+        try:
+            handles = pooled.window_handles
+            for handle in handles[1:]:
+                pooled.switch_to.window(handle)
+                pooled.close()
+            pooled.switch_to.window(handles[0])
+        except WebDriverException:
+            pass
+
+    def _quit(self, pooled):
+        try:
+            pooled.quit()
+        except WebDriverException:
+            pass
@@ -0,0 +1,158 @@
+# UNC-CH Computational Social Science Workshop
+# Finding out where the scraping time actually goes.
+#
+# A scrape feels slow, but is it the page loads (driver.get), finding elements, reading .text, clicking, or the
+# WebDriverWait polling? Every one of those is a command selenium sends to chromedriver, and every command goes through
+# one method, driver.execute. Here we wrap that method so each command is timed and written down along with which part
+# of the script ("phase") it happened in: login, advanced_search, save_xls, thread extraction, or whatever names you
+# use. The summary then shows, for each phase and each kind of command, how many calls there were and how long the
+# typical (p50) and the slow (p95) ones took. The full list of calls can be saved for a closer look later.
+#
+#     trace = DriverTrace()
+#     pool = DriverPool(size=4, factory=trace.factory())
+#     trace.phase('login')
+#     ...
+#     with trace.phase('save_xls'):
+#         save_xls()
+#     print(trace)
+#     trace.dump('trace.csv')
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from driver_pool import chromeprofile
+
+
+_FIELDS = ['phase', 'command', 'started', 'seconds', 'thread', 'error']
+
+
+class DriverTrace:
+    def __init__(self, default_phase='unlabeled'):
+        self.default_phase = default_phase
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._latest = None
+        self._origin = time.perf_counter()
+
+    # Use it either way: trace.phase('login') switches phase for everything after it, and
+    # with trace.phase('save_xls'): ... labels just the commands in the block. Threads that never set a phase of
+    # their own (the workers in fetch_fulltext, for example) use the phase that was set most recently anywhere.
+    def phase(self, name):
+        block = _PhaseBlock(self, getattr(self._local, 'phase', None), self._latest)
+        self._local.phase = name
+        self._latest = name
+        return block
+
+    def current_phase(self):
+        return getattr(self._local, 'phase', None) or self._latest or self.default_phase
+
+    # Starts timing every command on a driver. Works on a plain selenium driver or a PooledDriver from driver_pool.py.
+    def attach(self, driver):
+        target = getattr(driver, 'driver', driver)
+        if getattr(target, '_driver_trace', None) is self:
+            return driver
+        execute = target.execute
+
+        def traced(command, params=None):
+            started = time.perf_counter()
+            error = None
+            try:
+                return execute(command, params)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self.record(command, started, time.perf_counter() - started, error)
+
+        target.execute = traced
+        target._driver_trace = self
+        return driver
+
+    # A factory for DriverPool(factory=...) that attaches the trace to every browser the pool starts.
+    def factory(self, factory=chromeprofile):
+        def traced_factory(**profile):
+            return self.attach(factory(**profile))
+        return traced_factory
+
+    # Adds one event by hand, for timing something that isn't a WebDriver command (like a download) in the same report.
+    def record(self, command, started, seconds, error=None):
+        event = (self.current_phase(), command, started - self._origin, seconds, threading.current_thread().name, error)
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started, time.perf_counter() - started)
+
+    def frame(self):
+        with self._lock:
+            return pd.DataFrame(list(self.events), columns=_FIELDS)
+
+    # One row per phase and command: how many calls, how many failed, total seconds and the p50/p95/max of a single
+    # call in milliseconds. by='phase' gives one row per phase instead.
+    def summary(self, by=('phase', 'command')):
+        events = self.frame()
+        by = [by] if isinstance(by, str) else list(by)
+        if events.empty:
+            return pd.DataFrame(columns=by + ['calls', 'errors', 'total_s', 'p50_ms', 'p95_ms', 'max_ms'])
+        milliseconds = events['seconds'] * 1000
+        grouped = milliseconds.groupby([events[column] for column in by], sort=False)
+        table = pd.DataFrame({'calls': grouped.size(),
+                              'errors': events['error'].notna().groupby([events[c] for c in by], sort=False).sum(),
+                              'total_s': grouped.sum() / 1000,
+                              'p50_ms': grouped.quantile(0.5),
+                              'p95_ms': grouped.quantile(0.95),
+                              'max_ms': grouped.max()})
+        return table.sort_values('total_s', ascending=False).reset_index()
+
+    # Saves every event. .csv gives a spreadsheet, .json gives the Chrome trace format, which you can open at
+    # chrome://tracing (or ui.perfetto.dev) to see every command on a timeline, one row per thread.
+    def dump(self, path):
+        events = self.frame()
+        if path.endswith('.json'):
+            trace_events = [{'name': row.command, 'cat': row.phase, 'ph': 'X', 'ts': row.started * 1e6,
+                             'dur': row.seconds * 1e6, 'pid': 1, 'tid': row.thread,
+                             'args': {'error': row.error} if isinstance(row.error, str) else {}}
+                            for row in events.itertuples()]
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': trace_events}, f, allow_nan=False)
+        else:
+            events.to_csv(path, index=False)
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def __str__(self):
+        table = self.summary()
+        if table.empty:
+            return 'DriverTrace: no commands recorded'
+        total = table['total_s'].sum()
+        return ('DriverTrace: %d commands, %.1f s in WebDriver calls\n%s'
+                % (table['calls'].sum(), total, table.to_string(index=False, float_format=lambda x: '%.2f' % x)))
+
+
+class _PhaseBlock:
+    def __init__(self, trace, previous, previous_latest):
+        self.trace = trace
+        self.previous = previous
+        self.previous_latest = previous_latest
+
+    def __enter__(self):
+        return self.trace
+
+    def __exit__(self, *exc):
+        self.trace._local.phase = self.previous
+        self.trace._latest = self.previous_latest
@@ -0,0 +1,123 @@
+# UNC-CH Computational Social Science Workshop
+# Fetching the full text for every row of a ProQuest export, several articles at a time.
+#
+# scrape_newspaper_articles.py shows how to get the full text of one article: go to its DocumentURL, find the
+# contentPadingDocview div and read its p elements. Doing that one row after another for a 5,000 row export takes hours,
+# and almost all of that time is spent waiting for pages to load. Here several browsers from a DriverPool load articles
+# at the same time, and each page's text is read with a single execute_script call instead of one .text per paragraph.
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# Finds the same div and p elements as the script, and joins the paragraphs with spaces the same way. Returns null if
+# the div isn't there (for example if we got sent to the login page instead of the article).
+_FULLTEXT_JS = """
+var area = document.evaluate('//div[@class="contentPadingDocview"]', document, null,
+                             XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (area === null) { return null; }
+return Array.from(area.querySelectorAll('p')).map(function (p) { return p.innerText; }).join(' ');
+"""
+
+
+# The same paragraphs as one xpath, for the plain http fast path in http_fetch.py.
+FULLTEXT_XPATH = '//div[@class="contentPadingDocview"]//p'
+
+
+class FetchError(Exception):
+    pass
+
+
+def fetch_page_text(driver, url, cache=None, auth=None):
+    _open(driver, url, cache)
+    # If we got sent to the sign in page, log in again and have another go.
+    if auth is not None and auth.redirected(driver):
+        if cache is not None:
+            cache.forget(url)
+        auth.reauthenticate(driver)
+        _open(driver, url, cache)
+    text = driver.execute_script(_FULLTEXT_JS)
+    if text is None:
+        if cache is not None:
+            cache.forget(url)
+        raise FetchError('No contentPadingDocview div at ' + driver.current_url)
+    return text
+
+
+def _open(driver, url, cache):
+    if cache is not None:
+        cache.open(driver, url)
+    else:
+        driver.get(url)
+
+
+# Keeps track of how every url went: how long it took and, if it failed, why. print() it for a summary.
+class FetchReport:
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def failures(self):
+        return self.results[self.results['error'].notna()]
+
+    @property
+    def pages_per_second(self):
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return ('Fetched %d pages in %.1f s (%.2f pages/s), %d failed'
+                % (len(self.results), self.elapsed, self.pages_per_second, len(self.failures)))
+
+
+# urls is a column of a data frame, like newspaperxls['DocumentURL']. The text comes back as a column with the same
+# index, so you can assign it straight back with newspaperxls['fulltext'] = text. Rows that failed (after retrying)
+# are left empty and show up in report.failures. workers should be no bigger than the pool's size, otherwise the extra
+# workers just wait for a browser to come free. If you pass an HttpFetcher from http_fetch.py as http, each article is
+# tried as a plain http request first and only goes to a browser if that comes back empty. report.results has a source
+# column that says which one each row used. cache is an optional PageCache from page_cache.py for the browser route (give
+# the HttpFetcher its own cache= for the http route), so a rerun reads articles from disk instead of loading them again.
+# auth is an optional SessionStore from session_store.py, which logs the browser in again if an article sends it to the
+# sign in page.
+def fetch_fulltext(urls, pool, workers=4, retries=1, progress_every=100, http=None, cache=None, auth=None):
+    urls = pd.Series(urls)
+    text = pd.Series(None, index=urls.index, dtype=object)
+    rows = []
+
+    def fetch(row, url):
+        started = time.perf_counter()
+        error = None
+        for attempt in range(retries + 1):
+            try:
+                if http is not None:
+                    result = http.fetch(url, FULLTEXT_XPATH)
+                    if not result.items:
+                        raise FetchError('No contentPadingDocview paragraphs at ' + url)
+                    page_text, source = ' '.join(result.items), result.source
+                else:
+                    with pool.borrow() as driver:
+                        page_text, source = fetch_page_text(driver, url, cache, auth), 'browser'
+                return row, url, page_text, source, time.perf_counter() - started, None, attempt + 1
+            # Whatever goes wrong with one url is written down against that url, so the rest of the batch carries on.
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, str(e).strip().splitlines()[0] if str(e).strip() else '')
+        return row, url, None, None, time.perf_counter() - started, error, retries + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch, row, url) for row, url in urls.items() if isinstance(url, str) and url]
+        for done, future in enumerate(as_completed(futures), start=1):
+            row, url, page_text, source, seconds, error, attempts = future.result()
+            text[row] = page_text
+            rows.append({'row': row, 'url': url, 'source': source, 'seconds': seconds, 'attempts': attempts,
+                         'error': error})
+            if progress_every and done % progress_every == 0:
+                elapsed = time.perf_counter() - started
+                logger.info('Fetched %d/%d (%.2f pages/s)', done, len(futures), done / elapsed)
+    results = pd.DataFrame(rows, columns=['row', 'url', 'source', 'seconds', 'attempts', 'error'])
+    return text, FetchReport(results.sort_values('row', ignore_index=True), time.perf_counter() - started)
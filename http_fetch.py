@@ -0,0 +1,168 @@
+# UNC-CH Computational Social Science Workshop
+# Skipping the browser when a page doesn't need one.
+#
+# A browser has to download every image, script and font on a page and run all of its javascript before selenium can
+# read anything. A lot of the pages we scrape don't need any of that: a ProQuest docview page, the flps.newberry.org
+# listings and the dps.hawaii.gov blog are all plain html that's there as soon as the page arrives. For those we can
+# just ask the server for the html with the requests library and search it with the same xpath or css selector we'd
+# give selenium. If that comes back empty, or the site is one we know needs javascript, we fall back to a browser from
+# the DriverPool.
+#
+# This needs two more libraries: pip install requests lxml (and cssselect if you want to use css selectors).
+
+from urllib.parse import urlsplit
+
+import lxml.etree
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Reads the matching elements' text, or one of their attributes, out of the page in the browser in one call. For href
+# and src we read the property instead of the attribute, which gives the full url the same way get_attribute() does.
+_SELECT_JS = """
+var selector = arguments[0], by = arguments[1], attribute = arguments[2];
+var elements = [];
+if (by === 'xpath') {
+    var found = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var i = 0; i < found.snapshotLength; i++) { elements.push(found.snapshotItem(i)); }
+} else {
+    elements = Array.from(document.querySelectorAll(selector));
+}
+return elements.map(function (el) {
+    if (attribute === null) { return el.innerText; }
+    if ((attribute === 'href' || attribute === 'src') && el[attribute]) { return el[attribute]; }
+    return el.getAttribute(attribute);
+});
+"""
+
+
+# What fetch() gives back: the url, the matches (text, or attribute values), and whether they came from the plain
+# http request ('http') or from a browser ('browser').
+class FetchResult:
+    def __init__(self, url, items, source):
+        self.url = url
+        self.items = items
+        self.source = source
+
+    def __repr__(self):
+        return 'FetchResult(%r, %d items, source=%r)' % (self.url, len(self.items), self.source)
+
+
+# pool is a DriverPool to fall back on (leave it out to never use a browser). js_rendered is a list of hostnames we
+# already know need javascript, so we don't bother with the plain request for those. pool_maxsize is how many
+# connections to keep open per site. Reusing an open connection skips the connection and https setup on every page.
+# cache is an optional PageCache from page_cache.py: pages already in it aren't fetched again, and new ones are saved to
+# it. session is the name the cache files them under (the account we're logged in as, for example). auth is an optional
+# SessionStore from session_store.py: its saved cookies are used for every request, and if a page sends us to the sign
+# in page we log in again (once) and retry.
+class HttpFetcher:
+    def __init__(self, pool=None, js_rendered=(), user_agent=None, timeout=20, pool_maxsize=10, retries=2, cache=None,
+                 session='', auth=None):
+        self.pool = pool
+        self.js_rendered = set(js_rendered)
+        self.cache = cache
+        self.cache_session = session
+        self.auth = auth
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize,
+                              max_retries=Retry(total=retries, backoff_factor=0.5,
+                                                status_forcelist=(429, 500, 502, 503, 504)))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if user_agent is not None:
+            self.session.headers['User-Agent'] = user_agent
+        if auth is not None:
+            auth.inject_http(self.session)
+
+    # Copies the cookies and user agent from a logged in browser, so the plain requests look like they come from the
+    # same session. Cookies only come from the site the browser is currently on, so call this once per site.
+    def copy_browser_session(self, driver):
+        self.session.headers['User-Agent'] = driver.execute_script('return navigator.userAgent')
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     domain=cookie.get('domain'), path=cookie.get('path', '/'))
+
+    # Finds every element matching selector on the page at url. by is 'xpath' or 'css'. If attribute is given (like
+    # 'href' or 'src') you get that attribute back instead of the text.
+    def fetch(self, url, selector, by='xpath', attribute=None, js_rendered=False):
+        if not js_rendered and urlsplit(url).hostname not in self.js_rendered:
+            items = self._fetch_http(url, selector, by, attribute)
+            if items:
+                return FetchResult(url, items, 'http')
+        if self.pool is None:
+            return FetchResult(url, [], 'http')
+        with self.pool.borrow() as driver:
+            self._open(driver, url)
+            if self.auth is not None and self.auth.redirected(driver):
+                self.auth.reauthenticate(driver)
+                self.auth.inject_http(self.session)
+                if self.cache is not None:
+                    self.cache.forget(url, self.cache_session)
+                self._open(driver, url)
+            items = [item for item in driver.execute_script(_SELECT_JS, selector, by, attribute) if item is not None]
+        # cache.open() saves whatever the browser loaded. If that wasn't the page we wanted (an error or sign in page),
+        # throw the copy out, the same as the http route never saves it.
+        if not items and self.cache is not None:
+            self.cache.forget(url, self.cache_session)
+        return FetchResult(url, items, 'browser')
+
+    def _open(self, driver, url):
+        if self.cache is not None:
+            self.cache.open(driver, url, self.cache_session)
+        else:
+            driver.get(url)
+
+    def _fetch_http(self, url, selector, by, attribute):
+        if self.cache is not None:
+            content = self.cache.get(url, self.cache_session)
+            if content is not None:
+                return select(content.decode('utf-8'), url, selector, by, attribute)
+            if self.cache.cache_only:
+                return []
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException:
+            return []
+        if response.status_code != 200 or 'html' not in response.headers.get('Content-Type', 'html'):
+            return []
+        # Sent to the sign in page. Let the browser route log us in again.
+        if self.auth is not None and self.auth.is_auth_url(response.url):
+            return []
+        # Without a charset in the header, requests decodes html as Latin-1, which turns every curly quote into â€™.
+        # Pages that don't say are almost always UTF-8.
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = 'utf-8'
+        items = select(response.text, response.url, selector, by, attribute)
+        # Only save pages that had what we were looking for, so a login page we got redirected to isn't kept as the
+        # article.
+        if self.cache is not None and items:
+            self.cache.put(url, response.text, self.cache_session)
+        return items
+
+
+# The plain-html version of find_elements: search the html with the same xpath or css selector we'd give selenium.
+# A page lxml can't read at all (an empty one, say) counts as no matches. An xpath that picks out text or attributes
+# itself, like //a/@href or //p/text(), gives back those strings as they are (and count(//a) gives back the number).
+def select(html, url, selector, by='xpath', attribute=None):
+    try:
+        tree = lxml.html.fromstring(html, base_url=url)
+    except (lxml.etree.ParserError, lxml.etree.XMLSyntaxError):
+        return []
+    tree.make_links_absolute(url, resolve_base_href=True)
+    elements = tree.xpath(selector) if by == 'xpath' else tree.cssselect(selector)
+    if not isinstance(elements, list):
+        elements = [elements]
+    items = []
+    for element in elements:
+        if isinstance(element, str):
+            items.append(element.strip())
+        elif not hasattr(element, 'text_content'):
+            items.append(element)
+        elif attribute is None:
+            items.append(element.text_content().strip())
+        elif element.get(attribute) is not None:
+            items.append(element.get(attribute))
+    return items
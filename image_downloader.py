@@ -0,0 +1,186 @@
+# UNC-CH Computational Social Science Workshop
+# Downloading lots of images at once.
+#
+# troubleshooting_webpages.py downloads an image with urllib.request.urlretrieve, one at a time, and has to change
+# urllib's settings for the whole program (install_opener) just to send a user agent. That's fine for one image, but
+# we collect thousands of state corrections dashboards like the ones in images/. Here we use asyncio, which lets python
+# wait on many downloads at the same time without a thread for each one. Each image is written to disk as it arrives
+# rather than held in memory, a download that got cut off picks up where it left off, and an image we already have
+# (same bytes, even under a different url) isn't saved twice.
+#
+# This needs one more library: pip install aiohttp
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+_content_range = re.compile(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)')
+
+# The naming scheme already used in images/, like KY_2020-10-12.jpg. If a state has more than one image on the same
+# day, the later ones get _2, _3 and so on.
+def image_name(state, day, extension='.jpg', number=1):
+    if isinstance(day, (date, datetime)):
+        day = day.strftime('%Y-%m-%d')
+    suffix = '' if number == 1 else '_%d' % number
+    return '%s_%s%s%s' % (state.upper(), day, suffix, extension)
+
+
+def _sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest
+
+
+# Keeps track of which images we already have, by a hash of their contents. It's saved in the folder as hashes.json so
+# we don't have to re-read every image each time. The first time, it hashes whatever is already in the folder. urls.json
+# next to it remembers which file each url we've downloaded went to, so a rerun doesn't download it again at all.
+class HashIndex:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, 'hashes.json')
+        self.urls_path = os.path.join(directory, 'urls.json')
+        self.urls = {}
+        if os.path.exists(self.urls_path):
+            with open(self.urls_path) as f:
+                self.urls = json.load(f)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.hashes = json.load(f)
+        else:
+            self.hashes = {}
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(('.part', '.json')) and os.path.isfile(os.path.join(directory, name)):
+                    self.hashes.setdefault(_sha256_file(os.path.join(directory, name)).hexdigest(), name)
+        self.names = set(os.listdir(directory)) | set(self.hashes.values())
+
+    def save(self):
+        for path, data in ((self.path, self.hashes), (self.urls_path, self.urls)):
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(path + '.tmp', path)
+
+
+# jobs is a list of (url, state, day) tuples. Each one ends up in the results with a status:
+#   'downloaded' - saved under its {STATE}_{date}.jpg name
+#   'duplicate'  - the same image is already saved (path is the file it matches), so it wasn't saved again
+#   'skipped'    - we downloaded this url on an earlier run (path is where it went), so it wasn't asked for again
+#   'failed'     - something went wrong, see error. Run it again later and it picks up where it stopped.
+# A url that's in jobs more than once is only downloaded once (two downloads would write to the same partial file), and
+# the repeats come back as 'duplicate' of it ('skipped' if it was, or with its error if it failed).
+# per_host is how many downloads to run at the same time from any one website, so we don't hammer a single server.
+async def download_images(jobs, directory='downloaded_images', per_host=4, user_agent='Mozilla/5.0', timeout=60,
+                          chunk_size=64 * 1024):
+    os.makedirs(directory, exist_ok=True)
+    index = HashIndex(directory)
+    lock = asyncio.Lock()
+    connector = aiohttp.TCPConnector(limit_per_host=per_host)
+    headers = {'User-Agent': user_agent}
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        first = {}
+        for url, state, day in jobs:
+            first.setdefault(url, (state, day))
+        tasks = [_download_one(session, url, state, day, directory, index, lock, chunk_size)
+                 for url, (state, day) in first.items()]
+        downloaded = dict(zip(first, await asyncio.gather(*tasks)))
+    index.save()
+    results, returned = [], set()
+    for url, state, day in jobs:
+        result = downloaded[url]
+        if url in returned:
+            result = dict(result)
+            if result['status'] in ('downloaded', 'duplicate'):
+                result['status'] = 'duplicate'
+        returned.add(url)
+        results.append(result)
+    return results
+
+
+# The same thing for scripts that aren't using asyncio themselves (like all of ours).
+def download_all(jobs, **kwargs):
+    return asyncio.run(download_images(jobs, **kwargs))
+
+
+async def _download_one(session, url, state, day, directory, index, lock, chunk_size):
+    result = {'url': url, 'path': None, 'status': 'failed', 'sha256': None, 'error': None}
+    if url in index.urls and os.path.exists(os.path.join(directory, index.urls[url])):
+        result['path'] = os.path.join(directory, index.urls[url])
+        result['status'] = 'skipped'
+        return result
+    extension = os.path.splitext(urlsplit(url).path)[1].lower() or '.jpg'
+    # The partial file is named after the url, so a rerun finds it again no matter what order the jobs are in.
+    part = os.path.join(directory, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.part')
+    try:
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        digest = _sha256_file(part) if have else hashlib.sha256()
+        headers = {'Range': 'bytes=%d-' % have} if have else {}
+        restart = False
+        async with session.get(url, headers=headers) as response:
+            start, total = _parse_content_range(response.headers.get('Content-Range'))
+            if response.status == 416 and have and total == have:
+                # We already have every byte, the server has nothing left to send.
+                pass
+            elif response.status == 206 and have and start == have:
+                await _save(response, part, 'ab', digest, chunk_size)
+            elif response.status == 200 or response.status == 206 and start == 0:
+                # The server ignored our Range request (or there was nothing to resume), so start from the top.
+                digest = hashlib.sha256()
+                await _save(response, part, 'wb', digest, chunk_size)
+            elif response.status in (206, 416):
+                # The server sent a different piece than the one we asked for. Adding it on would mix up the file.
+                restart = True
+            else:
+                response.raise_for_status()
+                raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                                  message='Unexpected status')
+        if restart:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                digest = hashlib.sha256()
+                await _save(response, part, 'wb', digest, chunk_size)
+        result['sha256'] = digest.hexdigest()
+        async with lock:
+            if result['sha256'] in index.hashes:
+                os.remove(part)
+                result['path'] = os.path.join(directory, index.hashes[result['sha256']])
+                result['status'] = 'duplicate'
+                index.urls[url] = index.hashes[result['sha256']]
+                return result
+            number = 1
+            while image_name(state, day, extension, number) in index.names:
+                number += 1
+            name = image_name(state, day, extension, number)
+            os.replace(part, os.path.join(directory, name))
+            index.hashes[result['sha256']] = name
+            index.names.add(name)
+            index.urls[url] = name
+        result['path'] = os.path.join(directory, name)
+        result['status'] = 'downloaded'
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return result
+
+
+async def _save(response, part, mode, digest, chunk_size):
+    with open(part, mode) as f:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            f.write(chunk)
+            digest.update(chunk)
+
+
+# The first byte and the total size from a Content-Range header like 'bytes 100-999/1000' (or 'bytes */1000' on a 416).
+# Either is None if the server didn't say.
+def _parse_content_range(value):
+    found = _content_range.match(value or '')
+    if found is None:
+        return None, None
+    start, total = found.groups()
+    return (int(start) if start else None), (int(total) if total != '*' else None)
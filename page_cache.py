@@ -0,0 +1,228 @@
+# UNC-CH Computational Social Science Workshop
+# Keeping a copy of every page we've loaded, so re-running a script doesn't mean loading them all again.
+#
+# Scraping is iterative: you run the script, notice your regular expression or xpath missed something, fix it and run
+# it again. Every run loads every page from the internet again, even though the pages haven't changed. Here we save a
+# copy of each page (and each downloaded file) on disk the first time, and hand back that copy on the next run.
+#
+# A few details:
+#   - Pages are looked up by their url, tidied up so small differences (upper case hostnames, the order of ?a=1&b=2,
+#     #fragments) don't count as different pages. The session (for example which account we were logged in as) is part
+#     of the key too, since a logged in page can look different.
+#   - The contents are stored under a hash of the contents, so identical pages are only stored once.
+#   - ttl says how many seconds a copy stays good for, and can be different for each site. Reddit threads change all
+#     the time, ProQuest articles never do.
+#   - max_bytes caps how big the cache gets. When it's full, the copies we haven't used for the longest go first.
+#   - cache_only=True never goes to the internet at all. Anything not in the cache raises CacheMiss, which is handy
+#     when you're only working on your extraction code.
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from html import escape
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+_head_regex = re.compile(r'<head(\s[^>]*)?>', re.IGNORECASE)
+_script_regex = re.compile(r'<script\b[^>]*>.*?</script\s*>|<script\b[^>]*/>', re.IGNORECASE | re.DOTALL)
+_link_regex = re.compile(r'<link\b[^>]*>', re.IGNORECASE)
+_preload_regex = re.compile(r'\brel\s*=\s*["\']?[^"\'>]*\b(?:preload|modulepreload|prefetch)\b', re.IGNORECASE)
+
+
+# Tidies up a url so the same page always gets the same key: lower case scheme and hostname, no default port, no
+# #fragment, and the query parameters in sorted order.
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not (scheme == 'http' and parts.port == 80 or scheme == 'https' and parts.port == 443):
+        host = '%s:%d' % (host, parts.port)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    site TEXT NOT NULL,
+    session TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_sha256 ON entries (sha256);
+"""
+
+
+# directory is where the cache lives on disk. ttl is a dictionary of {hostname: seconds}, and default_ttl is used for
+# any site not in it (None means copies never go stale).
+#
+#     cache = PageCache('page_cache', ttl={'www.reddit.com': 3600}, max_bytes=2 * 1024 ** 3)
+#     html = cache.open(driver, url)
+class PageCache:
+    def __init__(self, directory='page_cache', ttl=None, default_ttl=None, max_bytes=None, cache_only=False):
+        self.directory = directory
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def key(self, url, session=''):
+        return hashlib.sha256((session + '\n' + normalize_url(url)).encode('utf-8')).hexdigest()
+
+    # Returns the saved copy of url as bytes, or None if we don't have one (or it's gone stale).
+    def get(self, url, session=''):
+        key = self.key(url, session)
+        with self._lock:
+            row = self._db.execute('SELECT site, sha256, fetched_at FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            site, sha256, fetched_at = row
+            ttl = self.ttl.get(site, self.default_ttl)
+            if ttl is not None and time.time() - fetched_at > ttl:
+                return None
+            try:
+                with open(self._blob_path(sha256), 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+            self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+        return content
+
+    def put(self, url, content, session=''):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(sha256)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(content)
+                os.replace(path + '.tmp', path)
+            now = time.time()
+            old = self._db.execute('SELECT sha256 FROM entries WHERE key = ?', (self.key(url, session),)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (self.key(url, session), url, urlsplit(url).hostname or '', session,
+                              sha256, len(content), now, now))
+            if old is not None and old[0] != sha256:
+                self._drop_blob_if_unused(old[0])
+            self._evict()
+            self._db.commit()
+
+    def forget(self, url, session=''):
+        key = self.key(url, session)
+        with self._lock:
+            row = self._db.execute('SELECT sha256 FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._drop_blob_if_unused(row[0])
+                self._db.commit()
+
+    # Where and when the saved copy of url came from: {'url': the url it was loaded from, 'fetched_at': a datetime}, or
+    # None if we don't have one. A page replayed from the cache was captured at fetched_at, not when it was replayed, so
+    # that's the time "3 hours ago" counts back from.
+    def info(self, url, session=''):
+        with self._lock:
+            row = self._db.execute('SELECT url, fetched_at FROM entries WHERE key = ?',
+                                   (self.key(url, session),)).fetchone()
+        if row is None:
+            return None
+        return {'url': row[0], 'fetched_at': datetime.fromtimestamp(row[1])}
+
+    # The page-source version of driver.get(url). If we have a fresh copy of the page, it's written into the browser
+    # (so execute_script extraction like reddit_extraction.py still works) without touching the internet. Otherwise the
+    # page is loaded for real and saved. prepare, if you give it, runs on the live page before it's saved, for things
+    # like clicking reddit's View button so the saved copy has every comment. Either way you get the html back, which
+    # you can also search with http_fetch.select(). Note that a page written in from the cache has about:blank as its
+    # address. A <base href> with the original url is added to it, so relative links still point at the right site and
+    # document.baseURI says where the page came from. The page's <script> tags (and the links telling the browser to
+    # preload scripts) are taken out first: the saved copy is the page after its javascript already ran, and running it
+    # again would download it all from the internet and could redraw the page (folding reddit's comments back up).
+    # info() tells you when it was saved. If the page turns out to be wrong (a login page, say) you can throw the copy
+    # out with forget().
+    def open(self, driver, url, session='', prepare=None):
+        content = self.get(url, session)
+        if content is not None:
+            html = content.decode('utf-8')
+            driver.get('about:blank')
+            driver.execute_script('document.open(); document.write(arguments[0]); document.close();',
+                                  _for_replay(html, url))
+            return html
+        if self.cache_only:
+            raise CacheMiss(url)
+        driver.get(url)
+        if prepare is not None:
+            prepare(driver)
+        html = driver.page_source
+        self.put(url, html, session)
+        return html
+
+    # How big the cache is right now, in bytes (each stored file counted once).
+    def size(self):
+        with self._lock:
+            return self._total_bytes()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.directory, 'blobs', sha256[:2], sha256)
+
+    def _total_bytes(self):
+        row = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM entries)')
+        return row.fetchone()[0]
+
+    # Deletes a stored file once no url points at it anymore. Returns True if it was deleted.
+    def _drop_blob_if_unused(self, sha256):
+        if self._db.execute('SELECT 1 FROM entries WHERE sha256 = ? LIMIT 1', (sha256,)).fetchone() is not None:
+            return False
+        try:
+            os.remove(self._blob_path(sha256))
+        except FileNotFoundError:
+            pass
+        return True
+
+    # Throws out the least recently used copies until we're back under max_bytes.
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        for key, sha256, size in self._db.execute(
+                'SELECT key, sha256, size FROM entries ORDER BY accessed_at').fetchall():
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            if self._drop_blob_if_unused(sha256):
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+def _for_replay(html, url):
+    html = _script_regex.sub('', html)
+    html = _link_regex.sub(lambda found: '' if _preload_regex.search(found.group(0)) else found.group(0), html)
+    base = '<base href="%s">' % escape(url)
+    found = _head_regex.search(html)
+    if found is None:
+        return base + html
+    return html[:found.end()] + base + html[found.end():]
@@ -0,0 +1,157 @@
+# UNC-CH Computational Social Science Workshop
+# Going through every page of a listing, several pages at a time.
+#
+# The Newberry loop in troubleshooting_webpages.py and the ProQuest results in Workshop_Webscraping.py both get to the
+# next page by clicking "Next". That means every page has to finish loading before we even find out where the next
+# one is. Usually the Next link is a normal link with a url in it, though, or the page urls follow a pattern
+# (?page=2, ?page=3, ...). Either way we can work out which pages exist and load several of them at once with browsers
+# from a DriverPool. For sites where the only way forward really is clicking, crawl_clicks() does that one page at a
+# time, without the fixed sleeps.
+#
+# Each crawl takes an extract function. It gets a driver that's on the page and returns whatever you want to keep from
+# that page (a list of rows, for example). An empty result means the page had nothing on it.
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from waits import Waiter
+
+
+# Every link matching the xpath, as full urls. Links that only run javascript don't go anywhere we can load ourselves,
+# so they're left out.
+_LINKS_JS = """
+var found = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var links = [];
+for (var i = 0; i < found.snapshotLength; i++) {
+    var href = found.snapshotItem(i).href;
+    if (href && href.indexOf('javascript:') !== 0) { links.push(href.split('#')[0]); }
+}
+return links;
+"""
+
+
+# What a crawl gives back. pages is a list of (url, whatever extract returned) in page order. stopped says why the crawl
+# ended: 'no more pages', 'empty page' or 'max_pages'. failed lists the pages that didn't load or whose extract raised,
+# as (url, error) pairs, so one bad page doesn't cost you all the others.
+class CrawlResult:
+    def __init__(self, pages, elapsed, stopped, failed=()):
+        self.pages = pages
+        self.elapsed = elapsed
+        self.stopped = stopped
+        self.failed = list(failed)
+
+    @property
+    def pages_per_second(self):
+        return len(self.pages) / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return ('CrawlResult(%d pages in %.1f s, %.2f pages/s, %d failed, stopped: %s)'
+                % (len(self.pages), self.elapsed, self.pages_per_second, len(self.failed), self.stopped))
+
+
+def _load(pool, waiter, url, extract, link_xpaths):
+    with pool.borrow() as driver:
+        driver.get(url)
+        waiter.ready(driver)
+        data = extract(driver)
+        links = []
+        for xpath in link_xpaths:
+            links.extend(driver.execute_script(_LINKS_JS, xpath))
+    return data, links
+
+
+# Follows the links on each page. next_xpath finds the Next link. If the page also has numbered page links
+# (1 2 3 ... 10), give an xpath for those as page_links_xpath: every page we can see a link to gets loaded straight away
+# instead of waiting to reach it through Next. Stops when there are no pages left we haven't loaded. With only
+# next_xpath that's still one page at a time, since we only find out where page 3 is once page 2 has loaded. A page
+# that fails goes in failed and its links are never followed, but the rest of the crawl carries on.
+def crawl_links(pool, start_url, extract, next_xpath='//a[contains(text(), "Next")]', page_links_xpath=None,
+                workers=4, max_pages=100, waiter=None):
+    waiter = waiter or Waiter(timeout=20)
+    link_xpaths = [xpath for xpath in (next_xpath, page_links_xpath) if xpath]
+    started = time.perf_counter()
+    seen = {start_url: 0}
+    loaded = {}
+    failed = []
+    stopped = 'no more pages'
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {executor.submit(_load, pool, waiter, start_url, extract, link_xpaths): start_url}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = running.pop(future)
+                try:
+                    data, links = future.result()
+                except Exception as e:
+                    failed.append((url, '%s: %s' % (type(e).__name__, e)))
+                    continue
+                loaded[url] = data
+                for link in links:
+                    if link in seen:
+                        continue
+                    if len(seen) >= max_pages:
+                        stopped = 'max_pages'
+                        break
+                    seen[link] = len(seen)
+                    running[executor.submit(_load, pool, waiter, link, extract, link_xpaths)] = link
+    pages = sorted(loaded.items(), key=lambda page: seen[page[0]])
+    failed.sort(key=lambda page: seen[page[0]])
+    return CrawlResult(pages, time.perf_counter() - started, stopped, failed)
+
+
+# For sites whose page urls follow a pattern. url_pattern has {page} where the page number goes, like
+# 'https://example.org/results?page={page}'. Pages are loaded workers at a time, and the crawl stops at the first page
+# that extract finds nothing on (pages after that one are thrown away, since we loaded them before we knew).
+def crawl_pattern(pool, url_pattern, extract, first_page=1, workers=4, max_pages=100, waiter=None):
+    waiter = waiter or Waiter(timeout=20)
+    started = time.perf_counter()
+    pages = []
+    failed = []
+    stopped = 'max_pages'
+    page = first_page
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(pages) < max_pages:
+            batch = range(page, min(page + workers, first_page + max_pages))
+            futures = [(executor.submit(_load, pool, waiter, url_pattern.format(page=number), extract, []),
+                        url_pattern.format(page=number)) for number in batch]
+            empty = False
+            for future, url in futures:
+                try:
+                    data, links = future.result()
+                except Exception as e:
+                    if not empty:
+                        failed.append((url, '%s: %s' % (type(e).__name__, e)))
+                    continue
+                if not data:
+                    empty = True
+                if not empty:
+                    pages.append((url, data))
+            if empty:
+                stopped = 'empty page'
+                break
+            page += workers
+    return CrawlResult(pages, time.perf_counter() - started, stopped, failed)
+
+
+# For sites where Next only works by clicking (ProQuest's results are like this: the page depends on the search you're
+# in the middle of). Uses the driver you're already on, extracts the current page, clicks Next, waits for the new page
+# and repeats until there's no Next link.
+def crawl_clicks(driver, extract, next_xpath='//a[contains(text(), "Next")]', max_pages=100, waiter=None):
+    waiter = waiter or Waiter(timeout=20)
+    started = time.perf_counter()
+    pages = [(driver.current_url, extract(driver))]
+    stopped = 'max_pages'
+    while len(pages) < max_pages:
+        try:
+            next_link = driver.find_element(By.XPATH, next_xpath)
+        except NoSuchElementException:
+            stopped = 'no more pages'
+            break
+        current_url = driver.current_url
+        next_link.click()
+        waiter.url_change(driver, current_url)
+        pages.append((driver.current_url, extract(driver)))
+    return CrawlResult(pages, time.perf_counter() - started, stopped)
@@ -0,0 +1,174 @@
+# UNC-CH Computational Social Science Workshop
+# Exporting every page of a ProQuest search, not just the first 100 results.
+#
+# The chain of functions in scrape_newspaper_articles.py (select_all, all_save, save_xls, deselect, save_button and
+# closing the popup) exports the 100 results on the page you're on. A search with 5,000 hits has 50 pages of those.
+# Here the same steps run on every page of results, clicking Next Page in between, and once everything has downloaded
+# the files are merged into one data set with each article only once. Articles are matched on their ProQuest id
+# (pq_id in data/floyd_news_md.csv), which is the number in the article's DocumentURL.
+#
+# Reading the .xls files needs one more library: pip install xlrd
+
+import logging
+import os
+import re
+
+import pandas as pd
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from downloads import DownloadWatcher
+from pagination import crawl_clicks
+from waits import Waiter
+
+logger = logging.getLogger(__name__)
+
+
+NEXT_PAGE_XPATH = '//a[@title="Next Page"]'
+docview_regex = re.compile(r'/docview/(\d+)')
+
+
+# The same steps as the script, but for whichever driver you pass in, and waiting on the page between clicks instead
+# of hoping it's ready. Call this while you're on a page of results. It leaves the driver back on the results page.
+def export_page(driver, waiter):
+    original_window = driver.current_window_handle
+    windows_before = len(driver.window_handles)
+    waiter.clickable(driver, (By.ID, 'mlcbAll')).click()
+    waiter.clickable(driver, (By.CSS_SELECTOR, '#allSaveOptionsLink > span.tool-option.dot-dot-dot > span')).click()
+    waiter.clickable(driver, (By.PARTIAL_LINK_TEXT, 'XLS')).click()
+    waiter.clickable(driver, (By.CSS_SELECTOR, '#saveAsFileResultsCount > div.col-md-8 > label')).click()
+    waiter.clickable(driver, (By.PARTIAL_LINK_TEXT, 'Continue')).click()
+    # Continue opens the download in a new tab. Wait for it, close it and go back to the results.
+    WebDriverWait(driver, waiter.timeout, poll_frequency=waiter.poll).until(
+        EC.number_of_windows_to_be(windows_before + 1))
+    for handle in driver.window_handles:
+        if handle != original_window:
+            driver.switch_to.window(handle)
+            driver.close()
+    driver.switch_to.window(original_window)
+
+
+# Exports every page of results for the search the driver is on right now, starting with the current page. Returns the
+# list of downloaded files. This is crawl_clicks() from pagination.py with the export as the extract function, so the
+# driver moves on to the next page only once the last page's file has finished downloading. on_file, if you give it,
+# gets each file's path as soon as it's there, so you can start reading it in while the rest are still downloading.
+# max_pages stops early if you only want the first few pages.
+def export_all_pages(driver, download_dir, waiter=None, max_pages=1000, on_file=None, download_timeout=120):
+    waiter = waiter or Waiter(timeout=20)
+
+    with DownloadWatcher(download_dir) as watcher:
+        def export(driver):
+            export_page(driver, waiter)
+            path = watcher.wait(download_timeout)
+            logger.info('Exported %s', os.path.basename(path))
+            if on_file is not None:
+                on_file(path)
+            return path
+
+        result = crawl_clicks(driver, export, next_xpath=NEXT_PAGE_XPATH, max_pages=max_pages, waiter=waiter)
+    logger.info('%s', result)
+    return [path for url, path in result.pages]
+
+
+# Works out the ProQuest id for every row. The exports have it in a StoreId column, and it's also the number after
+# /docview/ in the DocumentURL, so we use whichever is there.
+def pq_ids(export):
+    ids = pd.Series(pd.NA, index=export.index, dtype='string')
+    if 'StoreId' in export:
+        ids = export['StoreId'].astype('string').str.extract(r'(\d+)', expand=False)
+    if 'DocumentURL' in export:
+        ids = ids.fillna(export['DocumentURL'].astype('string').str.extract(docview_regex, expand=False))
+    return ids
+
+
+# Reads every exported file and stacks them into one data frame with a pq_id column. Articles that show up in more than
+# one file (overlapping searches, or a page that got exported twice) are only kept once.
+def merge_exports(paths):
+    return _merge([pd.read_csv(path) if path.endswith('.csv') else pd.read_excel(path) for path in paths])
+
+
+def _merge(frames):
+    frames = [frame.assign(pq_id=pq_ids(frame))[['pq_id'] + [c for c in frame.columns if c != 'pq_id']]
+              for frame in frames]
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({'pq_id': pd.Series(dtype='string')})
+    with_id = merged[merged['pq_id'].notna()].drop_duplicates('pq_id')
+    return pd.concat([with_id, merged[merged['pq_id'].isna()]], ignore_index=True)
+
+
+# SKIPPING THE DOWNLOAD
+# Everything the XLS has for a result (title, authors, publication, date and the link) is already on the results page.
+# Reading it straight off the page in one javascript call skips the eight clicks, the popup window and the file on disk.
+# The selectors ProQuest uses are in RESULT_SELECTORS, so if they change the layout you only need to fix them there.
+RESULT_SELECTORS = {
+    'row': 'li.resultItem',
+    'title': 'a[id^="citationDocTitleLink"], h3 a',
+    'author': '.titleAuthorETC .truncatedAuthor, .titleAuthorETC a[href*="author"]',
+    'details': '.titleAuthorETC',
+}
+
+# One row per result with the text of each part, and the link to the article. The details line is the authors, the
+# publication and the date run together ("Garcia, Uriel J. Arizona Republic; Phoenix, Ariz. [Phoenix, Ariz]. 06 June
+# 2020: A.1."), so we split that up in python.
+_RESULTS_JS = """
+var s = arguments[0];
+function text(el) { return el ? el.innerText.trim() : null; }
+return Array.from(document.querySelectorAll(s.row)).map(function (row) {
+    var title = row.querySelector(s.title);
+    var authors = Array.from(row.querySelectorAll(s.author)).map(text).filter(Boolean);
+    var link = title ? title.href : null;
+    if (!link || link.indexOf('/docview/') < 0) {
+        var docview = row.querySelector('a[href*="/docview/"]');
+        link = docview ? docview.href : link;
+    }
+    return [text(title), authors.join('; '), text(row.querySelector(s.details)), link];
+});
+"""
+
+result_date_regex = re.compile(r'(\d{1,2} [A-Z][a-z]+ \d{4}|[A-Z][a-z]{2,8}\.? \d{1,2}, \d{4}|\d{4}-\d{2}-\d{2})')
+RESULT_COLUMNS = ['Title', 'Authors', 'pubtitle', 'pubdate', 'DocumentURL', 'StoreId']
+
+
+# Splits the details line into the publication and the date. The publication comes after the authors and runs up to
+# the first [ (the place of publication in brackets) or the date, whichever comes first.
+def parse_details(details, authors):
+    if not details:
+        return None, None
+    found = result_date_regex.search(details)
+    date = found.group(1) if found else None
+    rest = details[len(authors):] if authors and details.startswith(authors) else details
+    rest = rest.lstrip(' .;,')
+    end = len(rest)
+    for marker in ('[', date):
+        if marker and marker in rest:
+            end = min(end, rest.index(marker))
+    publication = rest[:end].strip(' ;,:') or None
+    return publication, date
+
+
+# Reads every result on the page the driver is on in one call, with the same column names as the XLS export so the
+# rest of the script (and merge_exports) works the same either way.
+def read_results(driver, selectors=None):
+    rows = driver.execute_script(_RESULTS_JS, selectors or RESULT_SELECTORS)
+    records = []
+    for title, authors, details, link in rows:
+        publication, date = parse_details(details, authors)
+        found = docview_regex.search(link or '')
+        records.append([title, authors or None, publication, date, link, found.group(1) if found else None])
+    results = pd.DataFrame(records, columns=RESULT_COLUMNS)
+    results['pubdate'] = pd.to_datetime(results['pubdate'], errors='coerce', format='mixed')
+    return results
+
+
+# The XLS-free version of export_all_pages(): reads every page of results for the current search and returns them as
+# one data frame, each article once.
+def scrape_all_pages(driver, waiter=None, max_pages=1000, selectors=None):
+    waiter = waiter or Waiter(timeout=20)
+
+    def extract(driver):
+        waiter.ready(driver)
+        return read_results(driver, selectors)
+
+    result = crawl_clicks(driver, extract, next_xpath=NEXT_PAGE_XPATH, max_pages=max_pages, waiter=waiter)
+    logger.info('%s', result)
+    return _merge([frame for url, frame in result.pages])
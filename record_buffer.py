@@ -0,0 +1,129 @@
+# UNC-CH Computational Social Science Workshop
+# Collecting scraped rows without growing a data frame one row at a time.
+#
+# Adding rows with reddit_kia.loc[len(reddit_kia.index)] = [...] copies the whole data frame every time, so the more
+# you scrape the slower each new row gets. Instead we keep one plain python list per column, and only build a data frame
+# (or write to disk) once a whole chunk of rows has piled up. Every row is also checked against the columns you
+# declared, so a row with its values in the wrong order gets caught right away instead of ending up in the data.
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# What kind of python value each column type accepts, and whether it can be left empty (None).
+_ACCEPTS = {
+    'str': ((str,), True),
+    'int64': ((int, np.integer), False),
+    'Int64': ((int, np.integer), True),
+    'float64': ((float, int, np.floating, np.integer), True),
+    'bool': ((bool, np.bool_), False),
+    'datetime64[ns]': ((datetime.date, np.datetime64), True),
+}
+
+
+# The schema is a list of (column name, column type) pairs, in the order the columns should come out. chunk_size is how
+# many rows to hold before turning them into a data frame. If you give a path, each chunk is added to the end of that
+# csv file instead of being kept in memory, which is what you want for a scrape too big to hold at once.
+#
+#     records = RecordBuffer([('username', 'str'), ('post_time_numeric', 'Int64')], chunk_size=5000)
+#     records.append(['some_user', 3])
+#     records.append({'username': 'other_user', 'post_time_numeric': 7})
+#     reddit_kia = records.to_frame()
+
+class RecordBuffer:
+    def __init__(self, schema, chunk_size=10000, path=None):
+        self.schema = list(schema)
+        for name, dtype in self.schema:
+            if dtype not in _ACCEPTS:
+                raise SchemaError('Column %r has unsupported type %r' % (name, dtype))
+        self.columns = [name for name, dtype in self.schema]
+        self.chunk_size = chunk_size
+        self.path = path
+        self._buffers = {name: [] for name in self.columns}
+        self._frames = []
+        self._flushed_rows = 0
+
+    def __len__(self):
+        return self._flushed_rows + len(self._buffers[self.columns[0]])
+
+    # A row can be a list/tuple in schema order, or a dictionary keyed by column name (any order). Either way every value
+    # is checked against its column's type before anything is stored.
+    def append(self, row):
+        if isinstance(row, dict):
+            missing = [name for name in self.columns if name not in row]
+            extra = [name for name in row if name not in self._buffers]
+            if missing or extra:
+                raise SchemaError('Row columns do not match schema (missing %s, unexpected %s)' % (missing, extra))
+            values = [row[name] for name in self.columns]
+        else:
+            values = list(row)
+            if len(values) != len(self.columns):
+                raise SchemaError('Row has %d values but the schema has %d columns' % (len(values), len(self.columns)))
+        for (name, dtype), value in zip(self.schema, values):
+            self._check(name, dtype, value)
+        for name, value in zip(self.columns, values):
+            self._buffers[name].append(value)
+        if len(self._buffers[self.columns[0]]) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    # Turns whatever rows are waiting into a data frame chunk, and writes it to disk if there's a path.
+    def flush(self):
+        rows = len(self._buffers[self.columns[0]])
+        if rows == 0:
+            return
+        chunk = pd.DataFrame({name: self._column(name, dtype) for name, dtype in self.schema}, columns=self.columns)
+        if self.path is None:
+            self._frames.append(chunk)
+        else:
+            first_write = self._flushed_rows == 0 and not os.path.exists(self.path)
+            chunk.to_csv(self.path, mode='a', header=first_write, index=False)
+        self._flushed_rows += rows
+        self._buffers = {name: [] for name in self.columns}
+
+    def to_frame(self):
+        self.flush()
+        if self.path is not None:
+            if not os.path.exists(self.path):
+                return self._empty_frame()
+            dates = [name for name, dtype in self.schema if dtype == 'datetime64[ns]']
+            dtypes = {name: dtype for name, dtype in self.schema if dtype != 'datetime64[ns]'}
+            frame = pd.read_csv(self.path, dtype=dtypes, parse_dates=dates)
+            for name in dates:
+                frame[name] = frame[name].astype('datetime64[ns]')
+            return frame
+        if not self._frames:
+            return self._empty_frame()
+        return pd.concat(self._frames, ignore_index=True)
+
+    def _empty_frame(self):
+        return pd.DataFrame({name: self._column(name, dtype) for name, dtype in self.schema}, columns=self.columns)
+
+    def _column(self, name, dtype):
+        values = self._buffers[name]
+        if dtype == 'datetime64[ns]':
+            return pd.to_datetime(pd.Series(values, dtype=object)).astype(dtype)
+        return pd.Series(values, dtype=dtype)
+
+    def _check(self, name, dtype, value):
+        types, nullable = _ACCEPTS[dtype]
+        if value is None:
+            if nullable:
+                return
+            raise SchemaError('Column %r (%s) cannot be empty' % (name, dtype))
+        # True and False count as integers in python, but they almost always mean a column got mixed up.
+        if isinstance(value, (bool, np.bool_)) and dtype != 'bool':
+            raise SchemaError('Column %r (%s) got a boolean: %r' % (name, dtype, value))
+        if not isinstance(value, types):
+            raise SchemaError('Column %r (%s) got %s: %r. Are the values in schema order?'
+                              % (name, dtype, type(value).__name__, value))
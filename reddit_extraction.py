@@ -0,0 +1,341 @@
+# UNC-CH Computational Social Science Workshop
+# Pulling a whole reddit thread out of the page in one go.
+#
+# In Scraping_Reddit_Thread.py every .text, get_attribute() and find_element_by_xpath('..') is its own trip from python
+# to chromedriver and back. That's fine for learning, but on a thread with a couple thousand comments it's thousands of
+# trips. Here we send one piece of javascript to the browser with execute_script. It walks the page in the browser
+# itself and hands back everything at once as plain python lists and dictionaries.
+#
+# extract_thread() keeps what the script keeps: each comment's username, time and text, plus whether it's a reply. The
+# script finds comments by walking up from the "point" spans, so it never learns who replied to whom. extract_comments()
+# reads the comment elements themselves, so it also gets each comment's id, the id of the comment it replies to, how
+# deep it is in the thread and its score. It first clicks the "View entire discussion" and "N more replies" buttons, a
+# whole batch of them per round trip, so a big thread comes back complete instead of just the part reddit shows first.
+
+import hashlib
+import re
+from datetime import datetime
+
+
+# The same css selector the script uses for the block of comments under the original post.
+THREAD_SELECTOR = ('#SHORTCUT_FOCUSABLE_DIV > div:nth-child(4) > div > div._1npCwF50X2J7Wt82SZi6J0._3OGqXkiUb_0ZMlksb26boO'
+                   ' > div.u35lf2ynn4jHsVUwPmNU.Dx3UxiK86VcfkFQVHNXNi._3KaECfUAGLfWQPO5eNjMNl > div.uI_hDmU5GSiudtABRz_37'
+                   ' > div._2M2wOqmeoPVvcSsJ6Po9-V')
+
+# The same regular expressions as the script, compiled once here so every comment reuses them.
+post_time_regex = re.compile(
+    r'(\d*)(\s*)(year|years|month|months|week|weeks|day|days|hour|hours|minute|minutes|second|seconds)(\s*)(ago)')
+comment_regex = re.compile(
+    r'(.*)(\n)(.*)(\n)(.*)(\n)(.*)(\n)(\d*)(\s*)'
+    r'(year|years|month|months|week|weeks|day|days|hour|hours|minute|minutes|second|seconds)(\s*)(ago)(\n)(.*)')
+
+# The columns of the reddit_kia data frame in Scraping_Reddit_Thread.py, in order, for a RecordBuffer.
+REDDIT_KIA_SCHEMA = [('username', 'str'),
+                     ('original_post_title', 'str'),
+                     ('post_time_numeric', 'Int64'),
+                     ('post_time_units', 'str'),
+                     ('current_date', 'datetime64[ns]'),
+                     ('post_text', 'str'),
+                     ('original_post', 'int64'),
+                     ('reply', 'int64')]
+
+# The columns for the rows from comment_records(), one row per comment with its place in the reply tree.
+COMMENT_TREE_SCHEMA = [('comment_id', 'str'),
+                       ('parent_id', 'str'),
+                       ('depth', 'int64'),
+                       ('username', 'str'),
+                       ('score', 'Int64'),
+                       ('post_time_numeric', 'Int64'),
+                       ('post_time_units', 'str'),
+                       ('current_date', 'datetime64[ns]'),
+                       ('post_text', 'str')]
+
+# Each comment is a div with the Comment class and an id like t1_fxk2m9a.
+COMMENT_SELECTOR = 'div.Comment'
+
+# The text of the buttons that load more of the thread. "Continue this thread" isn't here because it opens a new page.
+EXPAND_PATTERN = r'^(view (entire discussion|more comments|all comments)|\d+ more repl(y|ies)|load more comments)'
+count_regex = re.compile(r'^(-?[\d.,]+)(k?)\s*(points?|comments?)$', re.IGNORECASE)
+
+
+# Every link with data-click-id="body" on the subreddit front page, minus the ads (the ones with no href).
+_THREAD_LINKS_JS = """
+return Array.from(document.querySelectorAll('[data-click-id="body"]'))
+    .map(function (a) {
+        var href = a.getAttribute('href');
+        return href === null ? null : (a.href || href);
+    })
+    .filter(function (href) { return href !== null; });
+"""
+
+# Finds the original post and its username, title, timestamp and paragraphs. Both of the scripts below start with it.
+_POST_JS = """
+function text(el) { return el ? el.innerText : null; }
+// A page written in from a PageCache is at about:blank, with its real address in a <base href>.
+var pageUrl = window.location.href === 'about:blank' ? document.baseURI : window.location.href;
+var post = document.querySelector('div[data-test-id="post-content"]');
+var original = null;
+if (post) {
+    original = {
+        username: text(post.querySelector('a[href*="/user/"]')),
+        title: text(post.querySelector('h1')),
+        timestamp: text(post.querySelector('a[data-click-id="timestamp"]')),
+        paragraphs: Array.from(post.querySelectorAll('p')).map(function (p) { return p.innerText; })
+    };
+}
+"""
+
+# This does in the browser what the script does one step at a time: find the original post, then find every span with
+# "point" in it and walk up two levels to the comment block.
+_THREAD_JS = _POST_JS + """
+var threadSelector = arguments[0];
+var thread = document.querySelector(threadSelector) || document;
+var points = document.evaluate('.//span[contains(text(), "point")]', thread, null,
+                               XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var blocks = [];
+for (var i = 0; i < points.snapshotLength; i++) {
+    var parent = points.snapshotItem(i).parentElement;
+    var block = parent ? parent.parentElement : null;
+    if (block) { blocks.push(block.innerText); }
+}
+return {url: pageUrl, post: original, comments: blocks};
+"""
+
+# Clicks up to batch of the visible load-more buttons at once, then waits until the page has stopped changing for
+# quiet_ms milliseconds. Buttons that were inside a collapsed part of the thread only become visible once it opens,
+# so they get their turn in the next round. Clicked buttons are marked so a button that stays on the page after its
+# click isn't clicked forever.
+_EXPAND_JS = """
+var pattern = new RegExp(arguments[0], 'i'), batch = arguments[1], quietMs = arguments[2];
+var commentSelector = arguments[3], done = arguments[arguments.length - 1];
+function buttons() {
+    return Array.from(document.querySelectorAll('button, [role="button"]')).filter(function (b) {
+        return !b.disabled && !b.dataset.expanded && b.getClientRects().length > 0 && pattern.test(b.innerText.trim());
+    });
+}
+function finish(clicked) {
+    done({clicked: clicked, remaining: buttons().length,
+          comments: document.querySelectorAll(commentSelector).length});
+}
+var clicked = buttons().slice(0, batch);
+clicked.forEach(function (b) { b.dataset.expanded = '1'; b.click(); });
+if (clicked.length === 0) { finish(0); return; }
+var timer = null;
+var observer = new MutationObserver(function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () { observer.disconnect(); finish(clicked.length); }, quietMs);
+});
+observer.observe(document.body, {childList: true, subtree: true, attributes: true});
+timer = setTimeout(function () { observer.disconnect(); finish(clicked.length); }, quietMs);
+"""
+
+# Every thread on a subreddit's front page with the comment count shown under it ("123 comments").
+_LISTING_JS = """
+return Array.from(document.querySelectorAll('[data-click-id="body"]'))
+    .filter(function (a) { return a.getAttribute('href') !== null; })
+    .map(function (a) {
+        var post = a.closest('.Post') || a.parentElement;
+        var count = post ? post.querySelector('[data-click-id="comments"]') : null;
+        return {url: a.href, comments: count ? count.innerText.trim() : null};
+    });
+"""
+
+# Reads every comment element in one go. The depth comes from reddit's hidden "level N" label, or failing that from
+# how far the comment is indented. The author, score and age are the short pieces of text around the comment body.
+# Comments whose ids are in the known list only send back what's needed to place them in the tree, not their text.
+_COMMENTS_JS = _POST_JS + """
+var threadSelector = arguments[0], commentSelector = arguments[1], known = new Set(arguments[2]);
+var root = document.querySelector(threadSelector) || document;
+var ageRe = /^\\d+\\s*(year|month|week|day|hour|minute|second)s?\\s+ago$/i;
+var scoreRe = /^(-?[\\d.,]+k?\\s*points?|score hidden)$/i, levelRe = /^level (\\d+)$/i;
+var comments = Array.from(root.querySelectorAll(commentSelector)).map(function (el) {
+    var comment = {id: el.id || null, level: null, indent: 0, author: null, score: null, age: null, text: null};
+    if (!comment.id) {
+        var match = /\\bt1_\\w+/.exec(el.className);
+        comment.id = match ? match[0] : null;
+    }
+    comment.known = known.has(comment.id);
+    var body = el.querySelector('[data-testid="comment"]');
+    if (!comment.known) {
+        comment.text = body ? body.innerText : null;
+        var user = el.querySelector('a[href*="/user/"]');
+        comment.author = user ? user.innerText : null;
+    }
+    el.querySelectorAll('*').forEach(function (child) {
+        if (child.children.length > 0 || (body && body.contains(child))) { return; }
+        var text = (child.textContent || '').trim();
+        var level = levelRe.exec(text);
+        if (level && comment.level === null) { comment.level = parseInt(level[1], 10); }
+        else if (scoreRe.test(text) && comment.score === null) { comment.score = text; }
+        else if (ageRe.test(text) && comment.age === null) { comment.age = text; }
+    });
+    comment.indent = parseFloat(window.getComputedStyle(el).paddingLeft) || 0;
+    return comment;
+});
+return {url: pageUrl, post: original, comments: comments};
+"""
+
+
+# One call instead of two get_attribute('href') calls per link.
+def thread_links(driver):
+    return driver.execute_script(_THREAD_LINKS_JS)
+
+
+# The front page's threads as [{'url': ..., 'comments': 123}], with comments None if the count couldn't be read.
+def thread_listing(driver):
+    return [{'url': thread['url'], 'comments': parse_count(thread['comments'])}
+            for thread in driver.execute_script(_LISTING_JS)]
+
+
+def parse_time(time_string):
+    match = post_time_regex.match(time_string or '')
+    if match is None or match.group(1) == '':
+        return None, None
+    return int(match.group(1)), match.group(3)
+
+
+def parse_comment(block):
+    match = comment_regex.match(block)
+    if match is None:
+        return None
+    time_numeric = int(match.group(9)) if match.group(9) else None
+    return {'username': match.group(3),
+            'post_time_numeric': time_numeric,
+            'post_time_units': match.group(11),
+            'post_text': match.group(15)}
+
+
+def _post(raw_post):
+    if raw_post is None:
+        return None
+    time_numeric, time_units = parse_time(raw_post['timestamp'])
+    return {'username': raw_post['username'],
+            'original_post_title': raw_post['title'],
+            'post_time_numeric': time_numeric,
+            'post_time_units': time_units,
+            'post_text': ' '.join(raw_post['paragraphs'])}
+
+
+# Pulls the original post and every comment on the thread that is currently open in the driver, in a single
+# execute_script call. captured_at is when the page was read, which is what "3 hours ago" counts back from. It's now
+# unless you say otherwise: for a page replayed from a PageCache, pass cache.info(url)['fetched_at']. Comment blocks
+# that don't fit the regular expression (deleted comments, "load more" stubs) are kept in 'unparsed' so you can see
+# what got skipped.
+def extract_thread(driver, thread_selector=THREAD_SELECTOR, captured_at=None):
+    captured_at = captured_at or datetime.now()
+    raw = driver.execute_script(_THREAD_JS, thread_selector)
+    thread = {'url': raw['url'], 'captured_at': captured_at, 'post': _post(raw['post']), 'comments': [],
+              'unparsed': []}
+    for block in raw['comments']:
+        comment = parse_comment(block)
+        if comment is None:
+            thread['unparsed'].append(block)
+        else:
+            thread['comments'].append(comment)
+    return thread
+
+
+# Turns an extracted thread into rows with the same columns as the reddit_kia data frame in the script: the original
+# post first, then one row per reply.
+def thread_records(thread, current_date):
+    title = thread['post']['original_post_title'] if thread['post'] else None
+    records = []
+    if thread['post'] is not None:
+        records.append(dict(thread['post'], current_date=current_date, original_post=1, reply=0))
+    for comment in thread['comments']:
+        records.append(dict(comment, original_post_title=title, current_date=current_date, original_post=0, reply=1))
+    return records
+
+
+# "1.2k points" is 1200, "12 comments" is 12, "Score hidden" is None.
+def parse_count(count_string):
+    match = count_regex.match((count_string or '').strip())
+    if match is None:
+        return None
+    number = float(match.group(1).replace(',', ''))
+    return int(round(number * 1000)) if match.group(2) else int(number)
+
+
+# Clicks the load-more buttons on the open thread, batch at a time, until there are none left or max_rounds rounds have
+# gone by. Returns how many buttons were clicked in each round.
+def expand_comments(driver, batch=50, max_rounds=20, quiet_ms=500, timeout=30, pattern=EXPAND_PATTERN,
+                    comment_selector=COMMENT_SELECTOR):
+    driver.set_script_timeout(timeout)
+    rounds = []
+    for _ in range(max_rounds):
+        state = driver.execute_async_script(_EXPAND_JS, pattern, batch, quiet_ms, comment_selector)
+        if state['clicked'] == 0:
+            break
+        rounds.append(state['clicked'])
+        if state['remaining'] == 0:
+            break
+    return rounds
+
+
+# Some comments come off the page without an id (deleted and removed ones, mostly). They still have replies, and we
+# still need to tell them apart from one poll to the next, so they get a stand-in id made from the author, the parent
+# and the text. The post time isn't part of it, since "3 hours ago" reads differently every time we look.
+def comment_key(author, parent, text):
+    key = '\x00'.join(str(value or '') for value in (author, parent, text))
+    return 'noid_' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+# Every comment with its id (or stand-in id), its parent's id and its depth, worked out from the order and depth of the
+# comments. Replies always come right after the comment they answer, so a comment's parent is the closest comment above
+# it that is one level shallower.
+def _place(raw_comments):
+    indents = sorted({c['indent'] for c in raw_comments if c['level'] is None})
+    placed = []
+    stack = []
+    for raw in raw_comments:
+        depth = raw['level'] - 1 if raw['level'] is not None else indents.index(raw['indent'])
+        del stack[depth:]
+        parent = stack[-1] if stack else None
+        comment_id = raw['id'] if raw['id'] is not None else comment_key(raw['author'], parent, raw['text'])
+        stack.append(comment_id)
+        placed.append((raw, comment_id, parent, depth))
+    return placed
+
+
+# The comments with their parents filled in. Comments marked as known, or whose (stand-in) id is in known, still count
+# as parents, but are left out of what comes back.
+def build_tree(raw_comments, known=()):
+    known = set(known)
+    comments = []
+    for raw, comment_id, parent, depth in _place(raw_comments):
+        if raw.get('known') or comment_id in known:
+            continue
+        time_numeric, time_units = parse_time(raw['age'])
+        comments.append({'id': comment_id,
+                         'parent': parent,
+                         'depth': depth,
+                         'author': raw['author'],
+                         'score': parse_count(raw['score']),
+                         'post_time_numeric': time_numeric,
+                         'post_time_units': time_units,
+                         'text': raw['text']})
+    return comments
+
+
+# The whole thread as a tree: the original post, plus every comment with its id, parent id (None for a reply to the
+# post itself), depth (0 for those top-level replies), author, score, age and text, in the order they appear on the
+# page. With expand=True the load-more buttons are clicked first. 'rounds' says how many buttons each round clicked.
+# known is a collection of comment ids you already have. Those are left out, so only the new comments come back, and
+# 'all_ids' lists every comment id on the page. Comments without an id get a stand-in one from comment_key(), both here
+# and in known. captured_at works the same as for extract_thread().
+def extract_comments(driver, expand=True, batch=50, max_rounds=20, thread_selector=THREAD_SELECTOR,
+                     comment_selector=COMMENT_SELECTOR, known=(), captured_at=None):
+    rounds = expand_comments(driver, batch, max_rounds, comment_selector=comment_selector) if expand else []
+    captured_at = captured_at or datetime.now()
+    raw = driver.execute_script(_COMMENTS_JS, thread_selector, comment_selector, list(known))
+    return {'url': raw['url'], 'captured_at': captured_at, 'post': _post(raw['post']),
+            'comments': build_tree(raw['comments'], known),
+            'all_ids': [comment_id for _, comment_id, _, _ in _place(raw['comments'])], 'rounds': rounds}
+
+
+# Rows with the COMMENT_TREE_SCHEMA columns, one per comment.
+def comment_records(tree, current_date):
+    return [{'comment_id': c['id'], 'parent_id': c['parent'], 'depth': c['depth'], 'username': c['author'],
+             'score': c['score'], 'post_time_numeric': c['post_time_numeric'],
+             'post_time_units': c['post_time_units'], 'current_date': current_date, 'post_text': c['text']}
+            for c in tree['comments']]
@@ -0,0 +1,74 @@
+# UNC-CH Computational Social Science Workshop
+# Turning "3 hours ago" into an actual date and time.
+#
+# Reddit never tells you when something was posted, only how long ago it was. The script pulls the number and the unit
+# apart and saves them next to date.today(), but never works out the real time. Here we do that for a whole column at
+# once: pandas matches the pattern against every string in one go, and the subtraction happens on the whole column
+# rather than in a python loop, so it stays fast even with millions of comments.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# One pattern for every unit reddit uses, including the short forms ("5 min. ago", "2 yr. ago"). The longer spellings
+# come first so "minutes" doesn't get matched as "min".
+relative_time_regex = re.compile(
+    r'^\s*(?P<numeric>\d+)\s*'
+    r'(?P<units>years?|yrs?|months?|mos?|weeks?|wks?|days?|d|hours?|hrs?|minutes?|mins?|seconds?|secs?)'
+    r'\.?\s+ago', re.IGNORECASE)
+just_now_regex = re.compile(r'^\s*just now', re.IGNORECASE)
+
+# How many seconds each unit is. Months and years aren't all the same length, so we use the average one. Reddit only
+# says "3 months ago" once the exact day stops mattering anyway.
+_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800,
+            'month': 2629746, 'year': 31556952}
+_SPELLINGS = {'second': ['second', 'seconds', 'sec', 'secs'],
+              'minute': ['minute', 'minutes', 'min', 'mins'],
+              'hour': ['hour', 'hours', 'hr', 'hrs'],
+              'day': ['day', 'days', 'd'],
+              'week': ['week', 'weeks', 'wk', 'wks'],
+              'month': ['month', 'months', 'mo', 'mos'],
+              'year': ['year', 'years', 'yr', 'yrs']}
+UNIT_SECONDS = {spelling: _SECONDS[unit] for unit, spellings in _SPELLINGS.items() for spelling in spellings}
+
+
+# Works from the number and the unit already pulled apart, like the post_time_numeric and post_time_units columns in
+# the reddit data frame. captured_at is when the page was scraped: either one time for everything, or a column with
+# the capture time of each row's page. Anything that can't be worked out comes back as NaT (pandas' missing time).
+def resolve_time_parts(numeric, units, captured_at):
+    numeric = pd.to_numeric(pd.Series(numeric), errors='coerce').astype('float64')
+    # Turning the units into a categorical means we only look up each distinct unit once, not once per row.
+    units = pd.Categorical(pd.Series(units, index=numeric.index, dtype=object))
+    unit_seconds = np.append(pd.Series(units.categories, dtype=object).str.lower().map(UNIT_SECONDS)
+                             .to_numpy(dtype='float64'), np.nan)
+    seconds = unit_seconds[units.codes]
+    return _subtract(numeric.to_numpy() * seconds, captured_at, numeric.index)
+
+
+# Works straight from the strings reddit shows, like "3 hours ago" or "just now". There are only so many different
+# strings like this ("3 hours ago" shows up thousands of times in a big scrape), so we match the pattern once per
+# distinct string and then copy the answer to every row that has it.
+def resolve_relative_times(times, captured_at):
+    times = pd.Series(times)
+    codes, distinct = pd.factorize(times)
+    distinct = pd.Series(distinct, dtype=object)
+    parts = distinct.str.extract(relative_time_regex)
+    just_now = distinct.str.match(just_now_regex).fillna(False).astype(bool)
+    parts.loc[just_now, 'numeric'] = '0'
+    parts.loc[just_now, 'units'] = 'second'
+    seconds = (pd.to_numeric(parts['numeric'], errors='coerce').astype('float64')
+               * parts['units'].str.lower().map(UNIT_SECONDS).astype('float64'))
+    # factorize marks missing strings with -1, which lands on the NaN we put on the end.
+    seconds = np.append(seconds.to_numpy(), np.nan)
+    return _subtract(seconds[codes], captured_at, times.index)
+
+
+def _subtract(seconds, captured_at, index):
+    ago = pd.to_timedelta(pd.Series(seconds, index=index), unit='s')
+    if isinstance(captured_at, pd.Series):
+        captured_at = pd.to_datetime(captured_at.set_axis(index))
+    else:
+        captured_at = pd.Timestamp(captured_at)
+    return captured_at - ago
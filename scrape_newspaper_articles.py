@@ -2,37 +2,47 @@
 # First thing we do is import all of the options we're going to need from selenium. This list expand or contract based
 # on the particular code you are working with, for now it will be relatively short
 import os
-from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
-import random
 from selenium.webdriver.support.ui import Select
-import pandas as pd
-
+from driver_pool import DriverPool
+from waits import Waiter
+from session_store import SessionStore
 
 
 # This chunk of code is important for one thing - Selenium cannot access your computer, it only interacts with the
 # webbrowser. The dialogue box that shows up when you click "download" and asks if you want to open it, save it, or
 # save to a location, is part of your computer and not the webbrowser. This lets you automatically download files to
-# a specific location on your computer. It defines a function with no arguments that sets the options for selenium.
+# a specific location on your computer. The chromeprofile() in driver_pool.py sets these options for selenium, and the
+# pool keeps the browser running between uses so we don't pay for starting chrome every time we need one. The pool can
+# hold up to 4 browsers, but it only starts them as they're needed. We only need more than one at the very end.
+
+download_dir = 'INSERT WORKING DIRECTORY HERE'
 
+# A DriverTrace from driver_trace.py times every command selenium sends to the browser, and notes which step of the
+# script it was for. trace.phase('...') below marks where each step starts. At the end, print(trace) shows where the
+# time went.
+from driver_trace import DriverTrace
+trace = DriverTrace()
 
-def chromeprofile():
-    options = webdriver.ChromeOptions()
-    prefs = {'download.default_directory': 'INSERT WORKING DIRECTORY HERE'}
-    options.add_experimental_option('prefs', prefs)
-    driver = webdriver.Chrome(options=options)
-    return driver
+pool = DriverPool(size=4, download_dir=download_dir, factory=trace.factory())
 
-driver = chromeprofile()
+driver = pool.acquire()
+
+# Instead of sleeping for a random amount of time between steps, we wait on the page itself with a Waiter from
+# waits.py. min_delay is a politeness floor: each pause takes at least that long. It's 0 here, so we never wait for
+# nothing. Set it (and jitter, for a random extra bit on top) if a site starts complaining that we're too fast.
+waiter = Waiter(timeout=20, min_delay=0, jitter=0)
 
 original_window = driver.current_window_handle
 
-def login(username, password):
+def login(username, password, driver=None):
+    # If we don't pass in a browser, log in with the one we borrowed at the top of the script.
+    if driver is None:
+        driver = globals()['driver']
     # We do things within the framework of "try" and "except" blocks of code. This lets us do some error handling, and
     # in particular lets us know if, when, and why our code fails. Instead of just breaking, it'll give us an easily
     # identifiable error and tell us what happened, and potentially let us make our code continue rather than just dying.
@@ -67,28 +77,45 @@ def login(username, password):
         WebDriverWait(driver, 20).until(
             EC.element_to_be_clickable((By.ID, "username")))
         onyenUsername = driver.find_element_by_id('username')
-        # This here is another wait, but it's telling python, not selenium, to wait for a random time between 0 and 1
-        # seconds, to simulate a person's reaction time. This is trying to make it look like a person is running the
-        # webbrowser rather than it being done by a computer.
-        time.sleep(random.uniform(0, 1))
+        # This used to be another wait, telling python, not selenium, to wait for a random time between 0 and 1
+        # seconds, to simulate a person's reaction time. The WebDriverWait above already makes sure the box is ready,
+        # so that time was wasted. waiter.pause() only waits if we've set a politeness floor on the waiter.
+        waiter.pause()
         # The username here is from the first argument of the function, it simply passes through what you typed as your
         # username.
         onyenUsername.send_keys(username)
-        # Another sleep command.
-        time.sleep(random.uniform(0, 1))
+        # Another pause.
+        waiter.pause()
         # Waiting for the password box to be clickable, making sure it's there.
         WebDriverWait(driver, 20).until(
             EC.element_to_be_clickable((By.ID, "password")))
         # Finding the password box.
         onyenPassword = driver.find_element_by_id('password')
-        time.sleep(random.uniform(0, 1))
+        waiter.pause()
         # Your password is generated by the second argument for the function, it's input then we hit the enter key.
         onyenPassword.send_keys(password + Keys.ENTER)
     except NoSuchElementException:
         print("No Such Element Found, Check ID of Username or Password")
+        # Then stop. Carrying on would save the cookies of a browser that never logged in.
+        raise
+
 
+# All that login really gets us is a few cookies. So rather than calling login() every time we start a browser, we keep
+# those cookies in a SessionStore from session_store.py. prepare() logs in only if we don't have saved cookies that are
+# still good, and otherwise just copies the saved ones into the browser. The cookies are saved in ezproxy_session.json,
+# so the next time you run the script you don't have to log in at all. Don't share that file, it's your login!
+session_store = SessionStore('ezproxy_session.json', login=lambda new_driver: login(username, password, new_driver))
+trace.phase('login')
+session_store.prepare(driver)
 
-login(username, password)
+# Every new browser the pool starts gets the same cookies, so it starts out logged in.
+pool.setup = session_store.prepare
+
+# With the cookies in place, the proxy link takes us straight through to the database. If it sends us to the sign in
+# page instead, the cookies must have run out, so log in again.
+driver.get('https://auth.lib.unc.edu/ezproxy_auth.php?url=http://www.nclive.org/cgi-bin/nclsm?rsrc=29')
+if session_store.redirected(driver):
+    session_store.reauthenticate(driver)
 
 
 def advanced_search():
@@ -107,6 +134,7 @@ def advanced_search():
         print("No Such Element Found, Advanced Search link after login")
 
 
+trace.phase('advanced_search')
 advanced_search()
 # So what you'll see on this window is that we are at the advanced search page in proquest. The newspaper that we want
 # to search within is selected by pubid(10482) in the search bar, so we now have to input our search terms and set up
@@ -115,13 +143,18 @@ advanced_search()
 def create_search():
     WebDriverWait(driver, 20).until(
         EC.element_to_be_clickable((By.ID, "queryTermField")))
-    time.sleep(random.uniform(0.5, 1.3))
+    waiter.pause()
     #Rather than finding by css selector, we're finding the ele
     secondsearchfield = driver.find_element_by_id("queryTermField_0")
     secondsearchfield.send_keys('("alt-right") OR (altright)')
-    time.sleep(random.uniform(0.4, 0.8))
+    waiter.pause()
+    old_url = driver.current_url
     secondsearchfield.send_keys(u'\ue007') #This is another way of sending enter.
+    # Pressing enter takes us to the results page. The search page is already loaded, so checking readyState right
+    # away would pass before we've left it. Wait for the url to change first, then for the results page to load.
+    waiter.url_change(driver, old_url)
 
+trace.phase('create_search')
 create_search()
 
 
@@ -136,8 +169,8 @@ def change_sorting():
     # easily and simply interact with the dropdown menue and change how the page is ordered. So first we define the
     # variable sortbar, using Select().
     sortbar = Select(driver.find_element_by_xpath('//*[@id="sortType"]'))
-    # Then we wait.
-    time.sleep(random.uniform(0.1, 0.5))
+    # Then we pause, if we've set a politeness floor.
+    waiter.pause()
     # Then we use the sortbar variable and the Select method's built in tools. If you again look at the html you can
     # see the options in the drop down menue. You can see the line that says
     # <option value="relevance">Relevance</option>. That bit there between the >< is "visible text," it's what is
@@ -153,9 +186,10 @@ def change_sorting():
 #    WebDriverWait(driver, 20).until(
 #        EC.element_to_be_clickable((By.XPATH, '//*[@id="sortType"]')))
 #    sortbar = Select(driver.find_element_by_xpath('//*[@id="sortType"]'))
-#    time.sleep(random.uniform(0.1, 0.5))
+#    waiter.pause()
 #    sortbar.select_by_visible_text("Oldest first")
 
+trace.phase('change_sorting')
 change_sorting()
 
 # Next, notice how there are only 20 articles displaying on the page. That's not very many, it's pretty inefficient
@@ -167,6 +201,7 @@ def items_per_page():
     items_per_page = Select(driver.find_element_by_id("itemsPerPage"))
     items_per_page.select_by_visible_text("100")
 
+trace.phase('items_per_page')
 items_per_page()
 
 # Select all on page
@@ -175,6 +210,7 @@ def select_all():
     select_all = driver.find_element_by_id("mlcbAll")
     select_all.click()
 
+trace.phase('select_all')
 select_all()
 
 # We can find the button by just using css selector, because there's nothing more readable than that we can use.
@@ -182,6 +218,7 @@ def all_save():
     all_save_options = driver.find_element_by_css_selector("#allSaveOptionsLink > span.tool-option.dot-dot-dot > span")
     all_save_options.click()
 
+trace.phase('save_xls')
 all_save()
 
 
@@ -205,6 +242,11 @@ def save_button():
     continue_save_button = driver.find_element_by_partial_link_text('Continue')
     continue_save_button.click()
 
+# Clicking Continue starts the download, but nothing tells us when it's finished or what the file is called. A
+# DownloadWatcher from downloads.py remembers what was already in the folder, so we make it before clicking.
+from downloads import DownloadWatcher
+
+watcher = DownloadWatcher(download_dir)
 save_button()
 
 def window_handles_handling():
@@ -215,24 +257,56 @@ def window_handles_handling():
 
 window_handles_handling()
 
+# Chrome saves the file as something.crdownload while it's downloading and renames it when it's done. wait() returns
+# the finished file's path as soon as that rename happens, so we don't need to go looking for it. trace.timed() adds
+# the wait to the trace too, so the download shows up next to the clicks that started it.
+with trace.timed('download'):
+    first_export = watcher.wait()
+watcher.close()
+print(first_export)
 
-driver = chromeprofile()
+
+# Running the whole chain a second time, but this time exporting every page of results instead of only the first 100.
+# We hand the browser back and borrow it again, which gets us the same warm browser. It's still logged in, so we can
+# skip login(). Going back to the proxy link takes us straight through to the database without the Onyen sign in.
+pool.release(driver)
+driver = pool.acquire()
 original_window = driver.current_window_handle
-login(username, password)
+trace.phase('advanced_search')
+driver.get('https://auth.lib.unc.edu/ezproxy_auth.php?url=http://www.nclive.org/cgi-bin/nclsm?rsrc=29')
 advanced_search()
+trace.phase('create_search')
 create_search()
+trace.phase('change_sorting')
 change_sorting()
+trace.phase('items_per_page')
 items_per_page()
-select_all()
-save_xls()
-deselect()
-save_button()
-window_handles_handling()
 
+# export_all_pages() in proquest.py does select all, save as XLS and close the popup on this page, waits for the file
+# to finish downloading, clicks Next Page, and keeps going until there is no Next Page. A 5,000 hit search is 50 files.
+# merge_exports() stacks them into one data frame and keeps each article once, matching them on their ProQuest id
+# (the pq_id column), so nothing gets counted twice if a page was exported twice.
+# It says which file it just exported as it goes. That goes through python's logging, which stays quiet unless you
+# switch it on, like this.
+import logging
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+from proquest import export_all_pages, merge_exports
 
+trace.phase('export_all_pages')
+exported_files = export_all_pages(driver, download_dir, waiter=waiter)
+newspaperxls = merge_exports(exported_files)
+newspaperxls.to_csv(os.path.join(download_dir, 'ProQuestDocuments-merged.csv'), index=False)
 
-# Now that we have the xls, let's open it and look at the data.
-newspaperxls = pd.read_excel('C:\\Users\\Will\\Documents\\ArticleLinks\\ProQuestDocuments-2020-11-20.xls')
+# If all you need from the XLS is the title, authors, publication, date and DocumentURL, you don't have to download it
+# at all. scrape_all_pages() reads those straight off each page of results in one call and gives back the same columns
+# (swap it in for the two lines above, starting from the first page of results):
+# from proquest import scrape_all_pages
+# newspaperxls = scrape_all_pages(driver, waiter=waiter)
+
+
+# Now that we have the xls, let's look at the data. If you only exported the one file, you can open it on its own with
+# pandas (import pandas as pd):
+# newspaperxls = pd.read_excel(first_export)
 
 #Get the header
 data_top = newspaperxls.head()
@@ -287,3 +361,73 @@ list(newspaperxls)
 # newspaperxls is the dataframe, loc is an access method
 newspaperxls.loc[2, 'fulltext'] = page_text_string
 newspaperxls.fulltext[2]
+
+
+# SCALING UP
+# That's one article. Doing it one row after another for a 5,000 row export takes hours, almost all of it waiting for
+# pages to load. fetch_fulltext() in fulltext_fetcher.py loads several articles at once, each in its own browser from
+# the pool, and gives us back the text for every row in the same order as the data frame. First we hand our browser
+# back so a worker can use it. The other browsers the pool starts get our saved login cookies (that's the pool.setup we
+# set earlier), and if an article sends one of them to the sign in page, session_store logs it in again.
+
+from fulltext_fetcher import fetch_fulltext
+from http_fetch import HttpFetcher
+from page_cache import PageCache
+
+# The article pages are plain html, so most of them don't need a browser at all. HttpFetcher asks for the html
+# directly, using our saved login cookies so ProQuest knows we're logged in, and only falls back to a browser from the
+# pool when that doesn't find the article text. Articles don't change once they're published, so we also keep a copy of
+# every one in a PageCache. Rerunning this reads them off the disk instead of going back to ProQuest.
+cache = PageCache('page_cache')
+http = HttpFetcher(pool=pool, cache=cache, session=username, auth=session_store)
+http.copy_browser_session(driver)
+
+pool.release(driver)
+
+trace.phase('fulltext')
+newspaperxls['fulltext'], report = fetch_fulltext(newspaperxls['DocumentURL'], pool, workers=4, http=http,
+                                                  auth=session_store)
+
+# The report tells us how fast that went, and which urls didn't work and why.
+print(report)
+report.failures
+
+# Save everything in a CorpusStore from corpus_store.py, so next session we don't have to read the xls files again. It
+# files each article under its pq_id, so running this again only replaces the articles we already had. Later on you
+# can read back just the columns and dates you need, like
+# store.read(columns=['pq_id', 'Title', 'fulltext'], start='2020-06-01', end='2020-06-07')
+from corpus_store import CorpusStore
+
+store = CorpusStore('corpus_store', date_column='pubdate')
+store.upsert(newspaperxls)
+
+# With the full text in hand we can also run new searches without going back to ProQuest. TextIndex from text_index.py
+# understands the same query language we typed into the search box (AND, OR, NOT, "phrases" and near/N), and you can
+# keep adding articles to it as you scrape more.
+from text_index import TextIndex
+
+index = TextIndex.from_frame(newspaperxls, text_column='fulltext', key='pq_id')
+alt_right = index.search_frame(newspaperxls, '("alt-right") OR (altright)')
+index.search('(alt-right near/5 rally) NOT "alt-right movement"')
+index.save('fulltext_index.pickle')
+
+# For text analysis we want the words in each article. count_matrix() from text_pipeline.py fixes any broken characters
+# first (so "can’t" doesn't turn into "can", "xe2", "x80", "x99t"), drops stop words and gives back a sparse matrix of
+# word counts: one row per article, one column per word. It can split the work across processes, but on Windows and
+# Macs every new process runs this whole file again from the top (starting chrome and logging in again), unless the
+# script sits under an if __name__ == '__main__': line. This script doesn't, so we keep it to one process with
+# workers=1. Run count_matrix() from its own script, or in that block, to use every core.
+from text_pipeline import count_matrix, load_stop_words
+
+stop_words = load_stop_words('data/custom_stop_words.csv')
+counts, vocabulary = count_matrix(newspaperxls['fulltext'], stop_words, workers=1)
+
+# Where did the time go? The summary has a row for each step and kind of command: how many there were, and how long the
+# typical (p50) and slowest (p95) ones took. trace.dump() saves every single command. A .json file opens on a timeline
+# at chrome://tracing.
+print(trace)
+trace.summary(by='phase')
+trace.dump('scrape_trace.json')
+
+# Shut down every browser in the pool now that we're done.
+pool.close()
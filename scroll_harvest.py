@@ -0,0 +1,91 @@
+# UNC-CH Computational Social Science Workshop
+# Scrolling a page until it stops loading new things.
+#
+# Some pages (the Medium post in troubleshooting_webpages.py is one) only load their images as you scroll down to them.
+# The script scrolls from 1000 to 9000 pixels, 300 at a time, sleeping a second each step. That's 27 seconds per page
+# whether the page is short or long, and whether or not what we wanted showed up on the first scroll. Here we scroll one
+# screen at a time and, after each scroll, pick up whatever new elements have appeared. We stop as soon as the element
+# we're after shows up, or once scrolling stops making the page longer and stops adding new elements.
+
+import time
+
+from waits import Waiter
+
+
+# Runs in the browser after every scroll. Elements we've already collected get marked with data-harvested so they're
+# only ever picked up once. Images that haven't loaded yet have no src, so they're skipped until they do.
+_SCROLL_JS = """
+var selector = arguments[0], attribute = arguments[1], until = arguments[2], step = arguments[3];
+function value(el) {
+    if (attribute === null) { return el.innerText; }
+    return el[attribute] || el.getAttribute(attribute);
+}
+window.scrollBy(0, step || window.innerHeight);
+var all = document.querySelectorAll(selector), fresh = [];
+all.forEach(function (el) {
+    if (el.dataset.harvested) { return; }
+    var v = value(el);
+    if (!v) { return; }
+    el.dataset.harvested = '1';
+    fresh.push(v);
+});
+var target = until === null ? null : document.querySelector(until);
+var root = document.documentElement;
+return {
+    fresh: fresh,
+    count: all.length,
+    height: root.scrollHeight,
+    bottom: window.innerHeight + window.scrollY >= root.scrollHeight - 2,
+    target: target === null ? null : (value(target) || null)
+};
+"""
+
+
+# What scroll_harvest() gives back: every value it collected (in the order they showed up), the value of the element
+# we were looking for if we found it, how many scrolls it took and how long.
+class HarvestResult:
+    def __init__(self, items, found, rounds, elapsed):
+        self.items = items
+        self.found = found
+        self.rounds = rounds
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return ('HarvestResult(%d items, found=%r, %d scrolls in %.1f s)'
+                % (len(self.items), self.found is not None, self.rounds, self.elapsed))
+
+
+# selector is a css selector for the elements to collect, like 'img'. attribute is what to collect from them ('src'
+# for images), or leave it out to collect their text. until is a css selector for the one element you really want.
+# Once it has shown up (and loaded), we stop scrolling. quiet_rounds is how many scrolls in a row at the bottom of the
+# page have to bring in nothing new before we decide the page is done. on_items, if you give it, is called with each
+# batch of new values as soon as they're collected, so you can save them as you go.
+def scroll_harvest(driver, selector, attribute=None, until=None, step=None, quiet_rounds=2, max_rounds=200,
+                   idle_ms=300, waiter=None, on_items=None):
+    waiter = waiter or Waiter(timeout=20)
+    started = time.perf_counter()
+    items = []
+    found = None
+    last = None
+    quiet = 0
+    rounds = 0
+    while rounds < max_rounds:
+        rounds += 1
+        state = driver.execute_script(_SCROLL_JS, selector, attribute, until, step)
+        if state['fresh']:
+            items.extend(state['fresh'])
+            if on_items is not None:
+                on_items(state['fresh'])
+        if state['target'] is not None:
+            found = state['target']
+            break
+        if state['bottom'] and not state['fresh'] and last == (state['height'], state['count']):
+            quiet += 1
+            if quiet >= quiet_rounds:
+                break
+        else:
+            quiet = 0
+        last = (state['height'], state['count'])
+        # Wait for whatever that scroll started loading, rather than a fixed second.
+        waiter.network_idle(driver, idle_ms=idle_ms)
+    return HarvestResult(items, found, rounds, time.perf_counter() - started)
@@ -0,0 +1,184 @@
+# UNC-CH Computational Social Science Workshop
+# Logging in once and reusing that login everywhere.
+#
+# login() in scrape_newspaper_articles.py goes through the whole Onyen sign in every time: load the proxy page, wait for
+# the button, wait for the username box, wait for the password box. What the login actually gets us is a handful of
+# cookies. So here we log in once, save those cookies to a file along with when they expire, and copy them into every
+# new browser from the pool (and into the plain http requests from http_fetch.py). We only log in again when a page we
+# ask for actually sends us back to the sign in page at auth.lib.unc.edu.
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+AUTH_HOST = 'auth.lib.unc.edu'
+# The Onyen single sign on pages the proxy sends us through. Still being on one of these means we aren't logged in.
+SSO_HOSTS = ('sso.unc.edu',)
+
+
+# The login function finished but the browser never made it past the sign in pages (a wrong password, or a sign in
+# page that changed).
+class LoginError(RuntimeError):
+    pass
+
+
+# path is the file the cookies are saved in. Keep it somewhere private, anyone with this file is logged in as you.
+# login is a function that takes a driver and logs it in, like lambda d: login(username, password, d).
+# session_hours is how long to trust cookies that don't say when they expire (the proxy's session cookies don't).
+# login_timeout is how long to wait, after login returns, for the browser to get past the sign in pages.
+#
+#     store = SessionStore('ezproxy_session.json', login=lambda d: login(username, password, d))
+#     pool = DriverPool(size=4, setup=store.prepare)
+class SessionStore:
+    def __init__(self, path='ezproxy_session.json', login=None, auth_host=AUTH_HOST, session_hours=8,
+                 sso_hosts=SSO_HOSTS, login_timeout=60):
+        self.path = path
+        self.login = login
+        self.auth_host = auth_host
+        self.sso_hosts = tuple(sso_hosts)
+        self.login_timeout = login_timeout
+        self.session_hours = session_hours
+        self.cookies = []
+        self.captured_at = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.load()
+
+    # Reads the saved cookies back in, dropping any that have expired.
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        self.captured_at = saved['captured_at']
+        self.cookies = [cookie for cookie in saved['cookies'] if not self._expired(cookie)]
+
+    # True if we have any saved cookies that haven't expired. The browser picks up cookies for every site it visits
+    # (analytics, image servers) and plenty of those only last minutes, so one of them running out doesn't mean the
+    # login has. Whether the login still works is only known when a page sends us to the sign in page, which is what
+    # redirected() and reauthenticate() are for.
+    def valid(self):
+        return bool(self.usable())
+
+    # The saved cookies that haven't expired yet.
+    def usable(self):
+        return [cookie for cookie in self.cookies if not self._expired(cookie)]
+
+    # Saves every cookie the browser has (for every site, not just the one it's on right now).
+    def capture(self, driver):
+        try:
+            cookies = driver.execute_cdp_cmd('Storage.getCookies', {})['cookies']
+            cookies = [_from_cdp(cookie) for cookie in cookies]
+        except (WebDriverException, AttributeError, KeyError):
+            cookies = driver.get_cookies()
+        self.cookies = cookies
+        self.captured_at = time.time()
+        # Only you can read the file (0600), since it's as good as your password.
+        with os.fdopen(os.open(self.path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            os.chmod(self.path + '.tmp', 0o600)
+            json.dump({'captured_at': self.captured_at, 'cookies': cookies}, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+        self._generation += 1
+
+    # Copies the saved cookies into a browser. This is what you give the pool as setup=, so every new browser starts
+    # out logged in. It only logs in here if there's nothing saved that hasn't expired. Otherwise whatever is still good
+    # goes in, and a page that sends us to the sign in page gets handled by reauthenticate().
+    def prepare(self, driver):
+        if not self.valid():
+            with self._lock:
+                if not self.valid():
+                    self._login(driver)
+                    return
+        self.inject(driver)
+
+    def inject(self, driver):
+        cookies = self.usable()
+        try:
+            driver.execute_cdp_cmd('Network.setCookies', {'cookies': [_to_cdp(cookie) for cookie in cookies]})
+            return
+        except (WebDriverException, AttributeError):
+            pass
+        # Browsers other than chrome can only add cookies for the site they're on, so visit each site first.
+        for domain in sorted({cookie['domain'].lstrip('.') for cookie in cookies}):
+            driver.get('https://%s/' % domain)
+            for cookie in cookies:
+                if cookie['domain'].lstrip('.') == domain:
+                    driver.add_cookie({key: value for key, value in cookie.items()
+                                       if key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry')})
+
+    # Copies the saved cookies into a requests session, like the one in an HttpFetcher.
+    def inject_http(self, session):
+        for cookie in self.usable():
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie.get('path', '/'))
+
+    # True if the browser got sent to the sign in page instead of where we asked to go.
+    def redirected(self, driver):
+        return self.is_auth_url(driver.current_url)
+
+    def is_auth_url(self, url):
+        host = urlsplit(url).hostname
+        return host == self.auth_host or host in self.sso_hosts
+
+    # Logs in again after we got bounced to the sign in page. If several browsers get bounced at once, only the first
+    # one logs in; the rest just pick up the fresh cookies it saved.
+    def reauthenticate(self, driver):
+        generation = self._generation
+        with self._lock:
+            if self._generation != generation:
+                self.inject(driver)
+                return
+            self._login(driver)
+
+    def _login(self, driver):
+        if self.login is None:
+            raise RuntimeError('Session expired and SessionStore has no login function')
+        self.login(driver)
+        self.wait_for_login(driver)
+        self.capture(driver)
+
+    # Pressing enter on the password box only starts the sign in, the browser still has to be sent back through the
+    # proxy. Saving the cookies before then would save the ones from before we logged in, and trust them for hours.
+    # So wait until the browser is off the sign in pages and the page it landed on has loaded.
+    def wait_for_login(self, driver):
+        try:
+            WebDriverWait(driver, self.login_timeout).until(
+                lambda d: not self.redirected(d) and d.execute_script('return document.readyState') == 'complete')
+        except TimeoutException:
+            raise LoginError('Still on the sign in page (%s) %s seconds after logging in'
+                             % (driver.current_url, self.login_timeout)) from None
+
+    def _expired(self, cookie):
+        now = time.time()
+        if cookie.get('expiry') is not None:
+            return cookie['expiry'] <= now
+        return self.captured_at is None or now - self.captured_at > self.session_hours * 3600
+
+
+# Chrome's devtools and selenium describe cookies slightly differently (expires vs expiry), so we convert between them
+# and always save selenium's version.
+def _from_cdp(cookie):
+    converted = {'name': cookie['name'], 'value': cookie['value'], 'domain': cookie['domain'],
+                 'path': cookie.get('path', '/'), 'secure': cookie.get('secure', False),
+                 'httpOnly': cookie.get('httpOnly', False)}
+    if not cookie.get('session', False) and cookie.get('expires', -1) > 0:
+        converted['expiry'] = int(cookie['expires'])
+    if cookie.get('sameSite'):
+        converted['sameSite'] = cookie['sameSite']
+    return converted
+
+
+def _to_cdp(cookie):
+    converted = {'name': cookie['name'], 'value': cookie['value'], 'domain': cookie['domain'],
+                 'path': cookie.get('path', '/'), 'secure': cookie.get('secure', False),
+                 'httpOnly': cookie.get('httpOnly', False)}
+    if cookie.get('expiry') is not None:
+        converted['expires'] = cookie['expiry']
+    if cookie.get('sameSite'):
+        converted['sameSite'] = cookie['sameSite']
+    return converted
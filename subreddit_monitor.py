@@ -0,0 +1,198 @@
+# UNC-CH Computational Social Science Workshop
+# Checking a subreddit again without scraping all of it again.
+#
+# If we scrape r/KotakuInAction every hour, most threads on the front page haven't changed since last time, and most of
+# the comments in the ones that have are comments we already have. Rereading all of them every time makes each run cost
+# as much as the whole subreddit, however quiet it's been. Here we keep a "watermark" for every subreddit and every
+# thread in a sqlite file: when we last looked, how many comments the front page said it had, and the id of every
+# comment we've already saved. Each run then
+#   - reads the front page once, with the comment count under each thread;
+#   - opens only the threads that are new, or whose count has changed since last time;
+#   - pulls out only the comments whose ids we haven't seen, and adds them to the end of a csv (the "deltas").
+# A quiet hour costs one page load, and a busy one costs one load per thread that actually got new comments.
+#
+#     monitor = SubredditMonitor('reddit_monitor.sqlite', deltas='reddit_kia_comments.csv')
+#     result = monitor.poll(driver, 'https://www.reddit.com/r/KotakuInAction/')
+#     print(result)
+#     result.comments    # just this run's new comments
+
+import re
+import sqlite3
+import threading
+import time
+
+from record_buffer import RecordBuffer
+from reddit_extraction import COMMENT_TREE_SCHEMA, comment_records, expand_comments, extract_comments, thread_listing
+
+
+# The comment tree columns, plus which subreddit and thread each comment came from.
+MONITOR_SCHEMA = [('subreddit', 'str'), ('thread_id', 'str')] + COMMENT_TREE_SCHEMA
+
+_thread_id = re.compile(r'/comments/([A-Za-z0-9]+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subreddits (
+    url TEXT PRIMARY KEY,
+    checked_at REAL NOT NULL,
+    threads INTEGER NOT NULL,
+    fetched INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    subreddit TEXT NOT NULL,
+    url TEXT NOT NULL,
+    comment_count INTEGER,
+    comments_seen INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS comments (
+    thread_id TEXT NOT NULL,
+    comment_id TEXT NOT NULL,
+    PRIMARY KEY (thread_id, comment_id)
+) WITHOUT ROWID;
+"""
+
+
+# The thread's id from its url (the part after /comments/), so old.reddit.com, redd.it-style and slugged links to the
+# same thread share one watermark.
+def thread_id(url):
+    found = _thread_id.search(url)
+    return found.group(1).lower() if found else url
+
+
+# Loads a thread and opens every "more replies" button, so the new comments are on the page.
+def open_thread(driver, url):
+    driver.get(url)
+    expand_comments(driver)
+
+
+# What one poll() did: how many threads were on the front page, which ones got opened, the new comments as a data
+# frame, and any threads that failed (as (url, error) pairs, their watermarks left alone so the next poll tries again).
+class PollResult:
+    def __init__(self, subreddit, listed, fetched, comments, failed, elapsed):
+        self.subreddit = subreddit
+        self.listed = listed
+        self.fetched = fetched
+        self.comments = comments
+        self.failed = failed
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return ('PollResult(%s: %d threads listed, %d opened, %d new comments, %d failed in %.1f s)'
+                % (self.subreddit, self.listed, len(self.fetched), len(self.comments), len(self.failed),
+                   self.elapsed))
+
+
+# path is the sqlite file the watermarks live in. deltas, if you give it, is a csv file every new comment is added to
+# the end of. A thread whose comment count can't be read off the front page is opened anyway once recheck seconds have
+# passed since it was last checked. open_thread is how a thread gets loaded, in case you want to go through a
+# PageCache or click something first.
+class SubredditMonitor:
+    def __init__(self, path='reddit_monitor.sqlite', deltas=None, recheck=6 * 60 * 60, open_thread=open_thread):
+        self.path = path
+        self.deltas = deltas
+        self.recheck = recheck
+        self.open_thread = open_thread
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    # Reads the subreddit's front page and opens the threads that are new or have changed. Returns a PollResult.
+    def poll(self, driver, subreddit_url, max_threads=None):
+        started = time.perf_counter()
+        driver.get(subreddit_url)
+        listing = thread_listing(driver)
+        changed = self.changed(listing)[:max_threads]
+        records = RecordBuffer(MONITOR_SCHEMA)
+        fetched, failed = [], []
+        for thread in changed:
+            try:
+                rows = self._fetch(driver, subreddit_url, thread['url'], thread['comments'])
+            except Exception as e:
+                failed.append((thread['url'], '%s: %s' % (type(e).__name__, e)))
+                continue
+            records.extend(rows)
+            fetched.append(thread['url'])
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO subreddits VALUES (?, ?, ?, ?)',
+                             (subreddit_url, time.time(), len(listing), len(fetched)))
+            self._db.commit()
+        return PollResult(subreddit_url, len(listing), fetched, records.to_frame(), failed,
+                          time.perf_counter() - started)
+
+    # The threads in a listing from thread_listing() that need opening: ones we've never seen, ones whose comment
+    # count is different from last time, and ones with no count that haven't been checked in recheck seconds.
+    def changed(self, listing):
+        now = time.time()
+        threads = []
+        with self._lock:
+            for thread in listing:
+                row = self._db.execute('SELECT comment_count, checked_at FROM threads WHERE thread_id = ?',
+                                       (thread_id(thread['url']),)).fetchone()
+                if row is None:
+                    threads.append(thread)
+                elif thread['comments'] is not None:
+                    if thread['comments'] != row[0]:
+                        threads.append(thread)
+                elif self.recheck is not None and now - row[1] > self.recheck:
+                    threads.append(thread)
+        return threads
+
+    # A thread's watermark: its comment count last time, how many comment ids we have, and when we first saw it and
+    # last checked it. None if we've never seen it.
+    def watermark(self, url):
+        with self._lock:
+            row = self._db.execute('SELECT subreddit, comment_count, comments_seen, first_seen, checked_at '
+                                   'FROM threads WHERE thread_id = ?', (thread_id(url),)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('subreddit', 'comment_count', 'comments_seen', 'first_seen', 'checked_at'), row))
+
+    def seen_comments(self, url):
+        with self._lock:
+            return {comment_id for (comment_id,) in
+                    self._db.execute('SELECT comment_id FROM comments WHERE thread_id = ?', (thread_id(url),))}
+
+    # The subreddit's watermark: when it was last polled, how many threads were listed and how many were opened.
+    def subreddit(self, subreddit_url):
+        with self._lock:
+            row = self._db.execute('SELECT checked_at, threads, fetched FROM subreddits WHERE url = ?',
+                                   (subreddit_url,)).fetchone()
+        return None if row is None else dict(zip(('checked_at', 'threads', 'fetched'), row))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Opens one thread and pulls out the comments we haven't seen. The new rows go to the deltas file before the
+    # watermark moves, so a crash in between means those comments come round again rather than getting lost.
+    def _fetch(self, driver, subreddit_url, url, comment_count):
+        key = thread_id(url)
+        known = self.seen_comments(url)
+        self.open_thread(driver, url)
+        # Comments without an id come back with a stand-in one from comment_key(), so they're remembered like the rest.
+        tree = extract_comments(driver, expand=False, known=known)
+        rows = [dict(row, subreddit=subreddit_url, thread_id=key)
+                for row in comment_records(tree, tree['captured_at'])]
+        if self.deltas is not None and rows:
+            buffer = RecordBuffer(MONITOR_SCHEMA, path=self.deltas)
+            buffer.extend(rows)
+            buffer.flush()
+        now = time.time()
+        with self._lock:
+            self._db.executemany('INSERT OR IGNORE INTO comments VALUES (?, ?)',
+                                 [(key, comment_id) for comment_id in tree['all_ids']])
+            seen = self._db.execute('SELECT COUNT(*) FROM comments WHERE thread_id = ?', (key,)).fetchone()[0]
+            self._db.execute('INSERT INTO threads VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (thread_id) DO UPDATE SET '
+                             'url = excluded.url, comment_count = excluded.comment_count, '
+                             'comments_seen = excluded.comments_seen, checked_at = excluded.checked_at',
+                             (key, subreddit_url, url, comment_count, seen, now, now))
+            self._db.commit()
+        return rows
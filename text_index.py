@@ -0,0 +1,310 @@
+# UNC-CH Computational Social Science Workshop
+# Running ProQuest-style searches on the articles we've already scraped.
+#
+# Once the fulltext column is filled in, asking a new question like '(police near/5 chokehold) OR ("I can't breathe")'
+# shouldn't mean going back to ProQuest and scraping everything again. Here we build an inverted index: for every word,
+# which articles it's in and at which positions. A search then only looks at the articles that contain the words in the
+# query instead of reading every article, and the positions are what make "phrases" and near/N work.
+#
+# The query language follows ProQuest's:
+#   - words and "quoted phrases", with * at the end of a word for any ending (protest* matches protesters, alt-right*
+#     matches alt-rightists)
+#   - AND, OR, NOT and parentheses. Two words with nothing between them count as AND.
+#   - a near/N b: a and b within N words of each other, in either order. a pre/N b: a comes first, then b within N words.
+# near/pre bind tightest, then AND and NOT, then OR, so 'a OR b AND c' means 'a OR (b AND c)'.
+#
+# Words are matched ignoring case, and punctuation splits words, so "alt-right" is the phrase alt right.
+
+import bisect
+import os
+import pickle
+import re
+from array import array
+
+
+word_regex = re.compile(r'\w+')
+_query_regex = re.compile(r'\s*(?:(?P<phrase>"[^"]*")|(?P<paren>[()])|(?P<proximity>(?:near|pre|n|p)/\d+)'
+                          r'|(?P<word>[^\s()"]+))', re.IGNORECASE)
+
+
+def tokenize(text):
+    return word_regex.findall(text.lower()) if text else []
+
+
+# Searching for a phrase or near/N needs to know where in the article the match is. Those results are kept as
+# {article: [(first word, last word), ...]}, everything else as a plain set of articles.
+class _Spans(dict):
+    def docs(self):
+        return set(self)
+
+
+def _merge_spans(a, b):
+    merged = _Spans(a)
+    for doc, spans in b.items():
+        merged[doc] = sorted(set(merged.get(doc, [])) | set(spans))
+    return merged
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+# The index itself. Add articles one at a time with add(), or a whole data frame with add_frame(). Adding an article id
+# that's already there replaces the old text, so you can keep adding new scrapes as they come in.
+#
+#     index = TextIndex.from_frame(newspaperxls, text_column='fulltext', key='pq_id')
+#     index.search('("alt-right") OR (altright)')
+class TextIndex:
+    def __init__(self):
+        self.postings = {}
+        self._doc_terms = {}
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def __contains__(self, doc):
+        return doc in self._doc_terms
+
+    @classmethod
+    def from_frame(cls, frame, text_column='fulltext', key='pq_id'):
+        index = cls()
+        index.add_frame(frame, text_column, key)
+        return index
+
+    def add_frame(self, frame, text_column='fulltext', key='pq_id'):
+        for doc, text in zip(frame[key], frame[text_column]):
+            if isinstance(text, str):
+                self.add(doc, text)
+
+    def add(self, doc, text):
+        if doc in self._doc_terms:
+            self.remove(doc)
+        positions = {}
+        for position, word in enumerate(tokenize(text)):
+            positions.setdefault(word, array('I')).append(position)
+        for word, found in positions.items():
+            self.postings.setdefault(word, {})[doc] = found
+        self._doc_terms[doc] = tuple(positions)
+        self._vocabulary = None
+
+    def remove(self, doc):
+        for word in self._doc_terms.pop(doc, ()):
+            postings = self.postings[word]
+            del postings[doc]
+            if not postings:
+                del self.postings[word]
+        self._vocabulary = None
+
+    # The ids of every article matching the query, sorted.
+    def search(self, query):
+        result = self._evaluate(_Parser(query).parse())
+        return sorted(result.docs() if isinstance(result, _Spans) else result)
+
+    # The same search, returned as the matching rows of a data frame.
+    def search_frame(self, frame, query, key='pq_id'):
+        return frame[frame[key].isin(self.search(query))]
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((self.postings, self._doc_terms), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as f:
+            index.postings, index._doc_terms = pickle.load(f)
+        return index
+
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == 'word':
+            return self._word(node[1])
+        if kind == 'phrase':
+            return self._phrase(node[1])
+        if kind == 'or':
+            left, right = self._evaluate(node[1]), self._evaluate(node[2])
+            if isinstance(left, _Spans) and isinstance(right, _Spans):
+                return _merge_spans(left, right)
+            return _docs(left) | _docs(right)
+        if kind == 'and':
+            return _docs(self._evaluate(node[1])) & _docs(self._evaluate(node[2]))
+        if kind == 'not':
+            return _docs(self._evaluate(node[1])) - _docs(self._evaluate(node[2]))
+        if kind in ('near', 'pre'):
+            left, right = self._evaluate(node[2]), self._evaluate(node[3])
+            if not (isinstance(left, _Spans) and isinstance(right, _Spans)):
+                raise QuerySyntaxError('%s/%d only works between words, phrases and ORs of those' % (kind, node[1]))
+            return _near(left, right, node[1], ordered=kind == 'pre')
+        raise QuerySyntaxError('Unknown query part %r' % (kind,))
+
+    def _word(self, word):
+        if word.endswith('*'):
+            spans = _Spans()
+            for term in self._prefix_terms(word[:-1]):
+                spans = _merge_spans(spans, self._word(term))
+            return spans
+        return _Spans({doc: [(p, p) for p in positions] for doc, positions in self.postings.get(word, {}).items()})
+
+    # Every word in the index that starts with prefix.
+    def _prefix_terms(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    # A word's postings, with a word ending in * standing for every word that starts with it.
+    def _postings(self, word):
+        if not word.endswith('*'):
+            return self.postings.get(word, {})
+        merged = {}
+        for term in self._prefix_terms(word[:-1]):
+            for doc, positions in self.postings[term].items():
+                merged.setdefault(doc, []).extend(positions)
+        return {doc: sorted(positions) for doc, positions in merged.items()}
+
+    # Articles where the phrase's words come one right after another. We start from the rarest word so we look at as
+    # few articles as possible.
+    def _phrase(self, words):
+        if not words:
+            return _Spans()
+        if len(words) == 1:
+            return self._word(words[0])
+        postings = [self._postings(word) for word in words]
+        rarest = min(range(len(words)), key=lambda i: len(postings[i]))
+        spans = _Spans()
+        for doc, positions in postings[rarest].items():
+            if not all(doc in p for p in postings):
+                continue
+            others = [set(p[doc]) for p in postings]
+            starts = [position - rarest for position in positions
+                      if all(position - rarest + i in others[i] for i in range(len(words)))]
+            if starts:
+                spans[doc] = [(start, start + len(words) - 1) for start in starts]
+        return spans
+
+
+def _docs(result):
+    return result.docs() if isinstance(result, _Spans) else result
+
+
+# Every pair of spans (one from each side) in the same article that are within distance words of each other. The result
+# covers both, so near/N can be chained ('a near/3 b near/3 c').
+def _near(left, right, distance, ordered=False):
+    spans = _Spans()
+    for doc in left.keys() & right.keys():
+        found = set()
+        rights = right[doc]
+        right_starts = [start for start, end in rights]
+        longest = max(end - start for start, end in rights)
+        for start, end in left[doc]:
+            # Only the right-hand spans that start close enough can match, so skip to those with a binary search.
+            low = bisect.bisect_left(right_starts, end + 1 if ordered else start - distance - 1 - longest)
+            high = bisect.bisect_right(right_starts, end + distance + 1)
+            for other_start, other_end in rights[low:high]:
+                if ordered:
+                    gap = other_start - end
+                    close = 0 < gap <= distance + 1
+                else:
+                    gap = max(other_start - end, start - other_end)
+                    close = gap <= distance + 1
+                if close:
+                    found.add((min(start, other_start), max(end, other_end)))
+        if found:
+            spans[doc] = sorted(found)
+    return spans
+
+
+# Turns the query text into a tree of ('or', left, right), ('and', ...), ('not', ...), ('near', N, left, right),
+# ('pre', N, left, right), ('phrase', [words]) and ('word', word).
+class _Parser:
+    def __init__(self, query):
+        self.tokens = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            found = _query_regex.match(query, position)
+            if found is None or found.end() == position:
+                raise QuerySyntaxError('Could not read the query at %r' % query[position:])
+            position = found.end()
+            kind = found.lastgroup
+            self.tokens.append((kind, found.group(kind)))
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError('Empty query')
+        node = self._or()
+        if self.position != len(self.tokens):
+            raise QuerySyntaxError('Unexpected %r in query' % self.tokens[self.position][1])
+        return node
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _keyword(self, *words):
+        kind, value = self._peek()
+        return kind == 'word' and value.upper() in words
+
+    def _or(self):
+        node = self._and()
+        while self._keyword('OR'):
+            self.position += 1
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._proximity()
+        while True:
+            if self._keyword('AND'):
+                self.position += 1
+                node = ('and', node, self._proximity())
+            elif self._keyword('NOT'):
+                self.position += 1
+                node = ('not', node, self._proximity())
+            elif self._starts_operand():
+                node = ('and', node, self._proximity())
+            else:
+                return node
+
+    def _starts_operand(self):
+        kind, value = self._peek()
+        return kind == 'phrase' or kind == 'word' and not self._keyword('OR') or (kind, value) == ('paren', '(')
+
+    def _proximity(self):
+        node = self._operand()
+        while self._peek()[0] == 'proximity':
+            operator, distance = self._peek()[1].lower().split('/')
+            self.position += 1
+            kind = 'pre' if operator in ('pre', 'p') else 'near'
+            node = (kind, int(distance), node, self._operand())
+        return node
+
+    def _operand(self):
+        kind, value = self._peek()
+        if kind is None:
+            raise QuerySyntaxError('Query ends too early')
+        self.position += 1
+        if kind == 'paren' and value == '(':
+            node = self._or()
+            if self._peek() != ('paren', ')'):
+                raise QuerySyntaxError('Missing )')
+            self.position += 1
+            return node
+        if kind == 'phrase':
+            return ('phrase', tokenize(value.strip('"')))
+        if kind == 'word' and value.upper() not in ('AND', 'OR', 'NOT'):
+            words = tokenize(value)
+            # A * on the end applies to the last word, so alt-right* is the phrase "alt" followed by right-anything.
+            if value.endswith('*') and words:
+                words[-1] += '*'
+            if len(words) == 1:
+                return ('word', words[0])
+            return ('phrase', words)
+        raise QuerySyntaxError('Unexpected %r in query' % value)
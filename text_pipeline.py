@@ -0,0 +1,180 @@
+# UNC-CH Computational Social Science Workshop
+# Turning the fulltext column into words we can count.
+#
+# Most of data/custom_stop_words.csv isn't words at all: xe2, x80, x9d, x99s, nthe, nin. Those are pieces of characters
+# that got saved the wrong way. A curly apostrophe is three bytes in UTF-8 (\xe2\x80\x99), and when text is saved as the
+# python representation of those bytes instead of as text, you get the characters \, x, e, 2 ... in the data, and a
+# line break becomes the letters \n glued to the next word ("nthe"). The tokenizer then splits those into "words" and we
+# have to filter them back out with stop words.
+#
+# Here we fix the text instead: clean_text() turns saved bytes, escape sequences and the usual wrong-decoding garbage
+# (â€™ for ’) back into the characters they were meant to be, and straightens curly quotes so "can’t" and "can't" are
+# the same word. After that the stop words only need to be real words. Tokenizing is split across several processes,
+# since it's pure python and one process only uses one core, and the counts come out as a sparse document-term matrix
+# (one row per article, one column per word, only the non-zero counts stored).
+#
+# This needs one more library: pip install scipy
+
+import ast
+import re
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+
+token_regex = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*|\d+(?:[.,]\d+)*", re.UNICODE)
+_bytes_repr_regex = re.compile(r"""^b(['"]).*\1$""", re.DOTALL)
+_hex_escape_regex = re.compile(r'\\x[0-9a-fA-F]{2}')
+_hex_run_regex = re.compile(r'(?<!\\)(?:\\x[0-9a-fA-F]{2})+')
+_char_escape_regex = re.compile(r'\\([ntr\'"\\])')
+_CHAR_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', "'": "'", '"': '"', '\\': '\\'}
+_mojibake_regex = re.compile('[ÂÃâ][\u0080-¿‘-›€ŒœŠšŸŽžƒˆ˜™]')
+_non_ascii_regex = re.compile(r'[^\x00-\x7f]+')
+_whitespace_regex = re.compile(r'\s+')
+_QUOTES = str.maketrans({'‘': "'", '’': "'", '‛': "'", '′': "'", '“': '"', '”': '"',
+                         '„': '"', '″': '"', '–': '-', '—': '-', ' ': ' '})
+
+# The snowball list of English stop words (the same words as tidytext's "snowball" lexicon), with the apostrophes
+# straightened like clean_text() does.
+STOP_WORDS = frozenset("""
+i me my myself we our ours ourselves you your yours yourself yourselves he him his himself she her hers herself it its
+itself they them their theirs themselves what which who whom this that these those am is are was were be been being
+have has had having do does did doing would should could ought i'm you're he's she's it's we're they're i've you've
+we've they've i'd you'd he'd she'd we'd they'd i'll you'll he'll she'll we'll they'll isn't aren't wasn't weren't
+hasn't haven't hadn't doesn't don't didn't won't wouldn't shan't shouldn't can't cannot couldn't mustn't let's that's
+who's what's here's there's when's where's why's how's a an the and but if or because as until while of at by for with
+about against between into through during before after above below to from up down in out on off over under again
+further then once here there when where why how all any both each few more most other some such no nor not only own
+same so than too very
+""".split())
+
+
+# Fixes text that was saved or decoded the wrong way. Safe to run on text that's already fine: it comes back unchanged
+# apart from straightened quotes and tidied whitespace.
+def clean_text(text):
+    if not isinstance(text, str):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', errors='replace')
+        else:
+            return text
+    text = text.strip()
+    # The whole thing is the python representation of some bytes: b'...'.
+    if _bytes_repr_regex.match(text):
+        try:
+            text = ast.literal_eval(text).decode('utf-8', errors='replace')
+        except (ValueError, SyntaxError, AttributeError):
+            pass
+    # Escape sequences written out as text: \xe2\x80\x99, \n. Only the escapes themselves are decoded, so real
+    # characters next to them (’, é) are left as they are. A single \n could be a real backslash (C:\new), so without
+    # any \x escapes we only decode those when there are several and no real line breaks.
+    escaped = _hex_escape_regex.search(text) is not None
+    if escaped:
+        text = _hex_run_regex.sub(_unescape_bytes, text)
+    if escaped or text.count('\\n') > 1 and '\n' not in text:
+        text = _char_escape_regex.sub(lambda found: _CHAR_ESCAPES[found.group(1)], text)
+    # UTF-8 bytes that were read as Windows-1252: â€™ instead of ’.
+    if _mojibake_regex.search(text):
+        text = _non_ascii_regex.sub(_redecode, text)
+    text = unicodedata.normalize('NFKC', text).translate(_QUOTES)
+    return _whitespace_regex.sub(' ', text).strip()
+
+
+# Turns one run of \x escapes back into the bytes they stand for and decodes those as UTF-8. A run that isn't valid
+# UTF-8 is most likely Latin-1 (\xe9 for é).
+def _unescape_bytes(found):
+    raw = bytes(int(escape[1:], 16) for escape in found.group(0).split('\\')[1:])
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+# Reads one run of non-ASCII characters back as the bytes they came from and decodes those as UTF-8. Runs that don't
+# turn into valid UTF-8 (real accented letters like é) are left alone. Windows-1252 has no character for five of the
+# bytes, and those come through as the matching control characters instead.
+def _redecode(found):
+    run = found.group(0)
+    try:
+        raw = b''.join(ch.encode('cp1252') if ch not in '\x81\x8d\x8f\x90\x9d' else ch.encode('latin-1')
+                       for ch in run)
+        return raw.decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return run
+
+
+# Reads stop word files in the layout of data/custom_stop_words.csv (a "word" column) and adds them to the built in
+# list. Entries that were only there to catch broken characters (x80, \\x9d, nthe) aren't needed once the text goes
+# through clean_text(), but they don't hurt either.
+def load_stop_words(*paths, words=(), base=STOP_WORDS):
+    stop_words = set(base) | {word.lower() for word in words}
+    for path in paths:
+        stop_words.update(pd.read_csv(path)['word'].dropna().astype(str).str.lower())
+    return frozenset(stop_words)
+
+
+def tokenize(text, stop_words=STOP_WORDS, clean=True):
+    if not isinstance(text, str):
+        return []
+    if clean:
+        text = clean_text(text)
+    return [token for token in token_regex.findall(text.lower()) if token not in stop_words]
+
+
+def _tokenize_chunk(texts, stop_words, clean):
+    return [tokenize(text, stop_words, clean) for text in texts]
+
+
+def _count_chunk(texts, stop_words, clean):
+    return [Counter(tokenize(text, stop_words, clean)) for text in texts]
+
+
+def _chunks(texts, chunk_size):
+    texts = list(texts)
+    return [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+
+
+def _map_chunks(function, texts, stop_words, clean, workers, chunk_size):
+    chunks = _chunks(texts, chunk_size)
+    if workers == 1 or len(chunks) <= 1:
+        return [function(chunk, stop_words, clean) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, chunks, [stop_words] * len(chunks), [clean] * len(chunks)))
+
+
+# Tokenizes a whole column (a fulltext Series, or any list of texts) across workers processes, chunk_size texts at a
+# time. workers=None uses every core. Returns one list of words per text, in the same order.
+#
+# On Windows, anything that starts worker processes has to be run from inside an if __name__ == '__main__': block.
+def tokenize_column(texts, stop_words=STOP_WORDS, workers=None, chunk_size=200, clean=True):
+    return [tokens for chunk in _map_chunks(_tokenize_chunk, texts, stop_words, clean, workers, chunk_size)
+            for tokens in chunk]
+
+
+# Counts every word in every text. Returns a scipy sparse matrix with one row per text and one column per word, and the
+# list of words for the columns (sorted). min_count drops words that appear fewer times than that in the whole corpus.
+#
+#     counts, vocabulary = count_matrix(newspaperxls['fulltext'], load_stop_words('data/custom_stop_words.csv'))
+def count_matrix(texts, stop_words=STOP_WORDS, workers=None, chunk_size=200, clean=True, min_count=1):
+    counters = [counter for chunk in _map_chunks(_count_chunk, texts, stop_words, clean, workers, chunk_size)
+                for counter in chunk]
+    totals = Counter()
+    for counter in counters:
+        totals.update(counter)
+    vocabulary = sorted(word for word, total in totals.items() if total >= min_count)
+    columns = {word: column for column, word in enumerate(vocabulary)}
+
+    indptr = np.zeros(len(counters) + 1, dtype=np.int64)
+    indices, data = [], []
+    for row, counter in enumerate(counters):
+        kept = [(columns[word], count) for word, count in counter.items() if word in columns]
+        kept.sort()
+        indices.extend(column for column, count in kept)
+        data.extend(count for column, count in kept)
+        indptr[row + 1] = indptr[row] + len(kept)
+    matrix = scipy.sparse.csr_matrix((np.array(data, dtype=np.int32), np.array(indices, dtype=np.int32), indptr),
+                                     shape=(len(counters), len(vocabulary)))
+    return matrix, vocabulary
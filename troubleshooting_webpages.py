@@ -1,6 +1,5 @@
-from selenium import webdriver
+from driver_pool import DriverPool
 import urllib.request
-import time
 #this script illustrates a few problems that could come up with webscraping
 #and it demonstrates how to diagnose these problems and avoid issues
 
@@ -15,14 +14,13 @@ import time
 
 
 # IMPORTANCE OF USER AGENT STRINGS
-def chromeprofile():
-    options = webdriver.ChromeOptions()
-    #notice here I am explicilty setting a user agent string, in this case firefox
-    options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:80.0) Gecko/20100101 Firefox/80.0')
-    driver = webdriver.Chrome(options=options)
-    return driver
-
-driver = chromeprofile()
+#notice here I am explicilty setting a user agent string, in this case firefox. The pool passes it on to chromeprofile()
+#in driver_pool.py every time it starts a browser, and keeps the browsers open until pool.close() at the end of this
+#script, so we can borrow them again below. the browsers run headless by default, so you won't see a window -- add
+#headless=False if you want to watch them
+pool = DriverPool(size=4, user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:80.0) Gecko/20100101 Firefox/80.0')
+
+driver = pool.acquire()
 driver.get('https://dps.hawaii.gov/blog/2020/03/17/coronavirus-covid-19-information-and-resources/')
 
 #note: the following css selector does not seem to be stable...
@@ -44,18 +42,40 @@ opener.addheaders=[('User-Agent','Mozilla/5.0')]
 urllib.request.install_opener(opener)    
 urllib.request.urlretrieve(output_url, filename)
 
-# after each browser session, you should close your driver
-driver.close()
+# that works for one image, but we collect thousands of these. image_downloader.py downloads a whole list of them at the
+# same time, sends the user agent without changing urllib for the whole script, and names each file the same way as
+# the ones in images/ (state_date.jpg). run it again and it skips images we already have and finishes any that got cut off
+#they go in downloaded_images/ rather than images/, which holds the examples that come with the workshop
+from datetime import date
+from image_downloader import download_all
+results = download_all([(output_url, 'HI', date.today())], directory='downloaded_images')
+print(results)
+
+# this page is plain html, so we don't actually need a browser to read it. http_fetch.py asks the server for the html
+# directly (with the same user agent) and searches it with the same css selector. it only opens a browser if that
+# comes back empty
+from http_fetch import HttpFetcher
+http = HttpFetcher(pool=pool, user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:80.0) Gecko/20100101 Firefox/80.0')
+result = http.fetch('https://dps.hawaii.gov/blog/2020/03/17/coronavirus-covid-19-information-and-resources/',
+                    '.primary-content > p:nth-child(19) > a:nth-child(1)', by='css', attribute='href')
+print(result.source, result.items)
+
+# after each browser session, you should close your driver -- or, with a pool, hand it back so it can be reused
+pool.release(driver)
 
 # PAUSING YOUR SCRIPT
 
     #learn to pause your script, occasionally to avoid being detected for abnormal behavior
 beginning_url = 'https://flps.newberry.org/'
-driver = webdriver.Chrome()
+driver = pool.acquire()
 driver.get(beginning_url)
 
-# wait for 5 seconds
-time.sleep(5)
+# we used to just wait for 5 seconds here. waits.py has a Waiter that asks the browser whether the page has actually
+# finished loading, and moves on as soon as it has. min_delay=1 means every wait takes at least 1 second, so we still
+# don't click through the site faster than a person would
+from waits import Waiter
+waiter = Waiter(timeout=20, min_delay=1)
+waiter.ready(driver)
 max_pages = 20
 
 for page_num in range(2, max_pages):
@@ -63,19 +83,37 @@ for page_num in range(2, max_pages):
     #make sure to print statements to know location of where your script breaks!
     print('Accessing page: ' + str(page_num))
     
-    #accesses the next page
+    #accesses the next page, then waits for the url to change and the new page to load
+    current_url = driver.current_url
     next_page_element = driver.find_element_by_partial_link_text('Next')
     next_page_element.click()
+    waiter.url_change(driver, current_url)
 
     #do something on the page (collect data)
 
-    # % means get the remainder when you the left number from the right number
-    #in this case, we mean if page_num is divisble by 5, then let's take a break for 30 seconds
-    if page_num % 5 == 0:
-        print('Taking a 5 second breather!')
-        time.sleep(5)
+    #we used to take a 5 second breather every fifth page here. the min_delay on the waiter already keeps us from
+    #going too fast, so we don't need it anymore
         
-driver.close()
+pool.release(driver)
+
+#how long did all that waiting actually take?
+print(waiter.summary())
+
+#the Next link is a normal link with a url in it, so pagination.py can read that url and load the page itself instead
+#of clicking. with only the Next link that's still one page at a time, since we don't know where page 3 is until page 2
+#has loaded. if a page has numbered page links too, pass an xpath for them as page_links_xpath and every page we can see
+#gets loaded at once with browsers from the pool (it holds up to 4). we pass in our waiter so every page still takes at
+#least a second. the extract function is the "do something on the page" part: it gets a driver that's on the page and
+#returns what to keep. a page that fails ends up in crawl.failed instead of stopping the whole crawl
+from pagination import crawl_links
+
+def page_title(page_driver):
+    return [page_driver.title]
+
+crawl = crawl_links(pool, beginning_url, page_title, next_xpath='//a[contains(text(), "Next")]', workers=4,
+                    max_pages=max_pages, waiter=waiter)
+print(crawl)
+print(crawl.failed)
 
 
 # IMPLICIT AND EXPLICIT WAITS
@@ -92,17 +130,20 @@ from selenium.webdriver.support import expected_conditions as EC
 
 # SOMETIMES only parts of websites load, so have to scroll down the website, and then specify my waiting to access certain elements
 #for whatever reason, in the following website some images don't load unless you scroll down in the browser
-driver = webdriver.Chrome()
+driver = pool.acquire()
 driver.get("https://medium.com/@MichiganDOC/mdoc-takes-steps-to-prevent-spread-of-coronavirus-covid-19-250f43144337")  
 
 #we can move the page (first number is x axis, second number is y axis)
 driver.execute_script('window.scrollTo(0, 500)')
 
-#from pixels 1000 to 9000, in intervals of 300, scroll down the website
-for page_location in range(1000, 9000, 300):
-    scroll_page_str = "window.scrollTo(0, " + str(page_location) + ")"
-    driver.execute_script(scroll_page_str)
-    time.sleep(1)
+#we used to scroll from pixels 1000 to 9000, in intervals of 300, sleeping a second each time. that's 27 seconds no
+#matter what. scroll_harvest.py scrolls a screen at a time, collects the image links as they show up, and stops as soon
+#as the image we want (the staff covid cases one) has loaded, or when the page stops getting longer
+from scroll_harvest import scroll_harvest
+harvest = scroll_harvest(driver, 'img', attribute='src',
+                         until='#root > div > article > div > section:nth-child(12) > div > div > figure > div > div > div > img')
+print(harvest)
+print(harvest.found)
     
 #examples of explicit wait commands:
     #this first one actually waits 10 seconds before throwing a TimeoutException error
@@ -123,5 +164,8 @@ except:
     print('The attempted code did not work, so run the following code: \n')
     correct_element_here = driver.find_element_by_css_selector('#edff')
     print(correct_element_here.text)
-                                                               
-                                                              
\ No newline at end of file
+
+pool.release(driver)
+
+#when you're done with all of them, shut the browsers in the pool down
+pool.close()
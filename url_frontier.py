@@ -0,0 +1,237 @@
+# UNC-CH Computational Social Science Workshop
+# Remembering which pages we've already scraped, across runs.
+#
+# workinglinks in Scraping_Reddit_Thread.py is a plain list, built from scratch every run, so every run scrapes every
+# thread again. Overlapping ProQuest exports have the same articles in them too, so their DocumentURLs get fetched more
+# than once. A frontier is the list of pages still to scrape, plus a record of every page we've ever scraped, kept in a
+# file so it lasts between runs. Adding a url we've already done (and that hasn't expired) does nothing.
+#
+# Two urls that look different often point at the same page, so every url is tidied up into a "key" first:
+#   - tracking parameters (utm_source, fbclid, and site-specific ones like youtube's si) are dropped;
+#   - reddit threads are keyed by their id, https://www.reddit.com/comments/<id>/, whether the link came from
+#     old.reddit.com, redd.it, with the subreddit and title in it or without;
+#   - ProQuest articles are keyed by their document id, whatever account or proxy the link came through.
+#
+# Checking "have we seen this?" for millions of urls is done in two steps. A Bloom filter (a compact bit array that can
+# say "definitely never seen" without touching the disk) answers most of them, and only the urls it isn't sure about
+# are looked up in the sqlite file. Pending urls come back out highest priority first.
+
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from page_cache import normalize_url
+
+
+# Parameters that only ever mean "where this click came from", dropped from every url (along with anything starting
+# with utm_).
+TRACKING_PARAMS = frozenset(('fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid', '_ga', '_gl'))
+# Names like ref, si or context are tracking on some sites and pick out the page on others (?context=3 on a forum post,
+# ?ref=... on a search), so they're only dropped on the sites we know use them for tracking. The hostname matches
+# subdomains too.
+SITE_TRACKING_PARAMS = {
+    'twitter.com': frozenset(('ref_src', 'ref_url', 's', 't')),
+    'x.com': frozenset(('ref_src', 'ref_url', 's', 't')),
+    'youtube.com': frozenset(('si', 'feature', 'pp')),
+    'youtu.be': frozenset(('si', 'feature')),
+    'open.spotify.com': frozenset(('si',)),
+    'instagram.com': frozenset(('igsh',)),
+    'proquest.com': frozenset(('accountid',)),
+    'cnn.com': frozenset(('cid', 'cmp', 'cmpid', 'ref', 'sr')),
+    'washingtonpost.com': frozenset(('sr_share', 'itid')),
+    'yahoo.com': frozenset(('ncid', 'soc_src', 'soc_trk')),
+    'msn.com': frozenset(('ocid', 'cvid')),
+    'medium.com': frozenset(('source', 'sk')),
+}
+_reddit_hosts = re.compile(r'^(?:www\.|old\.|new\.|np\.|m\.|i\.)?reddit\.com$')
+_reddit_permalink = re.compile(r'^(?:/r/[^/]+)?/comments/(?P<id>[a-z0-9]+)(?:/[^/]*(?:/(?P<comment>[a-z0-9]+))?)?',
+                               re.IGNORECASE)
+_docview = re.compile(r'/docview/(\d+)')
+
+
+# Turns a url into the key we file it under. Two urls with the same key are the same page.
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.endswith('proquest.com') or 'proquest' in host:
+        found = _docview.search(parts.path)
+        if found:
+            return 'https://www.proquest.com/docview/%s' % found.group(1)
+    if host == 'redd.it':
+        return 'https://www.reddit.com/comments/%s/' % parts.path.strip('/').lower()
+    if _reddit_hosts.match(host):
+        found = _reddit_permalink.match(parts.path)
+        if found:
+            path = '/comments/%s/' % found.group('id').lower()
+            if found.group('comment'):
+                path += '_/%s/' % found.group('comment').lower()
+            return urlunsplit(('https', 'www.reddit.com', path, '', ''))
+        return urlunsplit(('https', 'www.reddit.com', parts.path.rstrip('/').lower() + '/', '', ''))
+    dropped = TRACKING_PARAMS.union(*[params for site, params in SITE_TRACKING_PARAMS.items()
+                                      if host == site or host.endswith('.' + site)])
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in dropped and not key.lower().startswith('utm_')]
+    return normalize_url(urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), '')))
+
+
+# A Bloom filter sized for capacity urls with about error_rate false "maybe seen"s. It never says "not seen" about a
+# url that was added.
+class BloomFilter:
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    site TEXT NOT NULL,
+    priority REAL NOT NULL,
+    status TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    fetched_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS urls_pending ON urls (status, priority DESC, added_at);
+"""
+
+
+# path is the sqlite file the frontier lives in. ttl is a dictionary of {hostname: seconds} saying how long a scraped
+# page stays done before adding it again queues it up for another scrape, and default_ttl is used for any site not in
+# it (None means once it's done, it's done for good). max_attempts is how many times a url that keeps failing is
+# retried.
+#
+#     frontier = Frontier('reddit_frontier.sqlite', ttl={'www.reddit.com': 24 * 60 * 60})
+#     frontier.add_many(thread_links(driver))
+#     for url in frontier.pop(10):
+#         ...scrape it...
+#         frontier.done(url)
+class Frontier:
+    def __init__(self, path='frontier.sqlite', ttl=None, default_ttl=None, max_attempts=3, bloom_capacity=1000000):
+        self.path = path
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._bloom = BloomFilter(bloom_capacity)
+        for (key,) in self._db.execute('SELECT key FROM urls'):
+            self._bloom.add(key)
+        # A crash in the middle of a run leaves urls marked as being fetched. They go back in the queue.
+        self._db.execute("UPDATE urls SET status = 'pending' WHERE status = 'fetching'")
+        self._db.commit()
+
+    # Adds a url to the queue unless we've already got it (pending, or done and not yet expired). Returns True if it
+    # was queued. Higher priority urls come out of pop() first.
+    def add(self, url, priority=0):
+        with self._lock:
+            queued = self._add(url, priority, time.time())
+            self._db.commit()
+        return queued
+
+    # The same for a whole list, in one transaction. Returns how many were queued. priority can be one number for all
+    # of them or a list with one per url (like [len(urls) - i for i in range(len(urls))] to keep the page's order).
+    def add_many(self, urls, priority=0):
+        urls = list(urls)
+        priorities = priority if isinstance(priority, (list, tuple)) else [priority] * len(urls)
+        now = time.time()
+        with self._lock:
+            queued = sum(self._add(url, rank, now) for url, rank in zip(urls, priorities))
+            self._db.commit()
+        return queued
+
+    # True if we've already got the url, pending or done (and not expired).
+    def seen(self, url):
+        key = canonical_url(url)
+        if key not in self._bloom:
+            return False
+        with self._lock:
+            row = self._db.execute('SELECT site, status, fetched_at FROM urls WHERE key = ?', (key,)).fetchone()
+        return row is not None and not self._expired(*row)
+
+    # Takes the next n urls off the queue, highest priority first (oldest first among equals). They're marked as being
+    # fetched until you call done() or failed() with them.
+    def pop(self, n=1):
+        with self._lock:
+            rows = self._db.execute("SELECT key, url FROM urls WHERE status = 'pending' "
+                                    'ORDER BY priority DESC, added_at LIMIT ?', (n,)).fetchall()
+            self._db.executemany("UPDATE urls SET status = 'fetching' WHERE key = ?", [(key,) for key, url in rows])
+            self._db.commit()
+        return [url for key, url in rows]
+
+    def done(self, url):
+        with self._lock:
+            self._db.execute("UPDATE urls SET status = 'done', fetched_at = ?, attempts = attempts + 1 WHERE key = ?",
+                             (time.time(), canonical_url(url)))
+            self._db.commit()
+
+    # Puts a url that didn't work back in the queue (at a lower priority), until it has failed max_attempts times.
+    def failed(self, url):
+        with self._lock:
+            self._db.execute("UPDATE urls SET attempts = attempts + 1, priority = priority - 1, "
+                             "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE key = ?",
+                             (self.max_attempts, canonical_url(url)))
+            self._db.commit()
+
+    # How many urls are waiting.
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM urls WHERE status = 'pending'").fetchone()[0]
+
+    # A count of urls by status: pending, fetching, done and failed.
+    def counts(self):
+        with self._lock:
+            return dict(self._db.execute('SELECT status, COUNT(*) FROM urls GROUP BY status').fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add(self, url, priority, now):
+        key = canonical_url(url)
+        if key in self._bloom:
+            row = self._db.execute('SELECT site, status, fetched_at FROM urls WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                if not self._expired(*row):
+                    return False
+                self._db.execute("UPDATE urls SET status = 'pending', priority = ?, added_at = ?, url = ?, "
+                                 'attempts = 0 WHERE key = ?', (priority, now, url, key))
+                return True
+        self._bloom.add(key)
+        self._db.execute('INSERT INTO urls (key, url, site, priority, status, added_at) '
+                         "VALUES (?, ?, ?, ?, 'pending', ?)", (key, url, urlsplit(key).hostname or '', priority, now))
+        return True
+
+    # Only urls that were scraped successfully expire. Pending ones are still waiting, and failed ones stay failed.
+    def _expired(self, site, status, fetched_at):
+        if status != 'done' or fetched_at is None:
+            return False
+        ttl = self.ttl.get(site, self.default_ttl)
+        return ttl is not None and time.time() - fetched_at > ttl
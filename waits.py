@@ -0,0 +1,131 @@
+# UNC-CH Computational Social Science Workshop
+# Waiting for the page instead of waiting for the clock.
+#
+# The scripts pace themselves with time.sleep(): 5 seconds after a page load, 1 second per scroll step, a random
+# fraction of a second between typing into boxes. A fixed sleep is always either too short (the page isn't ready and
+# the script breaks) or too long (the page was ready ages ago and we're just sitting there). The waits here ask the
+# browser whether the thing we're waiting for has actually happened: the page finished loading, the network went quiet,
+# the part of the page we care about stopped changing, or the url changed after a click. They return as soon as it has.
+#
+# If you want to be polite to a website, you can still set a minimum delay. Every wait then takes at least that long,
+# but never longer than it needs to beyond that. Every wait is also timed, so you can see where the time actually goes.
+
+import logging
+import random
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+
+# Runs inside the browser. Resolves once no new network requests have finished for idle_ms milliseconds.
+_NETWORK_IDLE_JS = """
+var idleMs = arguments[0], done = arguments[arguments.length - 1];
+var last = performance.getEntriesByType('resource').length, quietSince = Date.now();
+var timer = setInterval(function () {
+    var now = performance.getEntriesByType('resource').length;
+    if (now !== last) { last = now; quietSince = Date.now(); }
+    else if (document.readyState === 'complete' && Date.now() - quietSince >= idleMs) {
+        clearInterval(timer);
+        done(true);
+    }
+}, 50);
+"""
+
+# Runs inside the browser. Watches the element matching the selector with a MutationObserver and resolves once it
+# exists and hasn't changed for quiet_ms milliseconds.
+_SETTLED_JS = """
+var selector = arguments[0], quietMs = arguments[1], done = arguments[arguments.length - 1];
+var observer = null, timer = null;
+function settleLater() {
+    clearTimeout(timer);
+    timer = setTimeout(function () { if (observer) { observer.disconnect(); } done(true); }, quietMs);
+}
+function watch() {
+    var target = document.querySelector(selector);
+    if (target === null) { setTimeout(watch, 50); return; }
+    observer = new MutationObserver(settleLater);
+    observer.observe(target, {childList: true, subtree: true, characterData: true, attributes: true});
+    settleLater();
+}
+watch();
+"""
+
+
+# timeout is how long any one wait can take before giving up with a TimeoutException, the same as WebDriverWait.
+# min_delay is the politeness floor in seconds, and jitter adds up to that many random seconds on top of it, which
+# does the same job as the random.uniform() sleeps did. Both are 0 by default, so waits only take as long as the page.
+class Waiter:
+    def __init__(self, timeout=20, min_delay=0.0, jitter=0.0, poll=0.05):
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.jitter = jitter
+        self.poll = poll
+        self.history = []
+
+    # document.readyState is 'complete' once the page and everything in it has loaded.
+    def ready(self, driver, state='complete'):
+        def check():
+            WebDriverWait(driver, self.timeout, poll_frequency=self.poll).until(
+                lambda d: d.execute_script('return document.readyState') == state)
+        return self._timed('ready', check)
+
+    # Waits until the page has stopped loading things in the background, which is what the sleeps after scrolling
+    # were really waiting for.
+    def network_idle(self, driver, idle_ms=500):
+        return self._timed('network_idle', lambda: self._async(driver, _NETWORK_IDLE_JS, idle_ms))
+
+    # Waits until the part of the page matching the css selector exists and has stopped changing.
+    def settled(self, driver, selector, quiet_ms=300):
+        return self._timed('settled', lambda: self._async(driver, _SETTLED_JS, selector, quiet_ms))
+
+    # For clicks that go to a new page, like the Next link. Remember the url before you click, then wait for it to
+    # change and for the new page to load.
+    def url_change(self, driver, old_url):
+        def check():
+            WebDriverWait(driver, self.timeout, poll_frequency=self.poll).until(EC.url_changes(old_url))
+            WebDriverWait(driver, self.timeout, poll_frequency=self.poll).until(
+                lambda d: d.execute_script('return document.readyState') == 'complete')
+        return self._timed('url_change', check)
+
+    # The same as WebDriverWait(driver, 20).until(EC.element_to_be_clickable(locator)), but it checks more often than
+    # every half second and it's timed. Returns the element.
+    def clickable(self, driver, locator):
+        return self._timed('clickable', lambda: WebDriverWait(driver, self.timeout, poll_frequency=self.poll).until(
+            EC.element_to_be_clickable(locator)))
+
+    # Just the politeness floor on its own, for the spots where the scripts used to sleep for no particular reason.
+    # With the default settings this doesn't wait at all.
+    def pause(self):
+        return self._timed('pause', lambda: None)
+
+    # A summary of how long each kind of wait took: how many, total seconds and the longest one.
+    def summary(self):
+        totals = {}
+        for name, seconds in self.history:
+            count, total, longest = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (count + 1, total + seconds, max(longest, seconds))
+        return {name: {'count': count, 'total': total, 'max': longest}
+                for name, (count, total, longest) in totals.items()}
+
+    def _async(self, driver, script, *args):
+        driver.set_script_timeout(self.timeout)
+        try:
+            return driver.execute_async_script(script, *args)
+        except TimeoutException:
+            raise TimeoutException('Gave up after %s seconds' % self.timeout)
+
+    def _timed(self, name, wait):
+        started = time.perf_counter()
+        result = wait()
+        waited = time.perf_counter() - started
+        floor = self.min_delay + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if waited < floor:
+            time.sleep(floor - waited)
+        total = time.perf_counter() - started
+        self.history.append((name, total))
+        logger.debug('%s took %.3f s (page ready after %.3f s)', name, total, waited)
+        return result